@@ -0,0 +1,314 @@
+"""Benchmarks the chance, school lookup, and optimization hot paths.
+
+For each synthetic csdata table (see synthetic_csdata.py) of the chosen row
+and school counts, times:
+    - Building the table and its school_stats summary
+    - chance_query for every school's PhD and MS
+    - chance_calc per school and degree, for each chance method
+    - school_directory_load and the school_directory_search lookups made by
+      school_data_in
+Then, on random schools with calculated chances, times optimize_overall_calc
+for each (n, k) and method, and optimize_tier_calc. Last, times the cold
+start of the CLI entry point modules, each imported by a new interpreter.
+
+Results are written as JSON, with the commit and environment, for comparison
+across commits. The run exits with status 1 if a module's median import time
+is over the cold-start budget, or if importing it loads SciPy, so the check
+can gate changes (--cold-start-only runs just that). Run this file with
+--help for the options.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from math import comb
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program"),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")]
+
+from chance import chance_calc, chance_query  # noqa: E402
+from data.test_user_school_data import test_user_data  # noqa: E402
+from database import sqlite_connect  # noqa: E402
+from optimize import optimize_overall_calc, optimize_tier_calc  # noqa: E402
+from school_directory import school_directory_load, school_directory_search  # noqa: E402
+from synthetic_csdata import synthetic_sqlite  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+LOOKUP_QUERIES = ("Stan", "MIT", "university", "Carnegie Mellon University (CMU)", "Synthetic University 4")
+
+# Exhaustive searches are only timed up to this many combinations.
+MAX_EXHAUSTIVE_COMBOS = 200000
+
+# Modules whose cold start is checked, i.e. CLI entry points and worker imports.
+COLD_START_MODULES = ("chance", "batch", "optimize", "school_directory")
+DEFAULT_COLD_START_BUDGET = 0.5
+
+
+def bench_time(function, repeats):
+    """Times repeated calls of a function.
+
+    :param function: Function without arguments.
+    :param repeats: Int number of timed calls.
+    :return: Dict of 'Min', 'Median' and 'Mean' seconds, and 'Repeats'.
+    """
+    seconds = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    return {"Min": min(seconds),
+            "Median": statistics.median(seconds),
+            "Mean": statistics.mean(seconds),
+            "Repeats": repeats}
+
+
+def bench_csdata(db_dir, num_rows, num_schools, methods, repeats):
+    """Benchmarks the database paths on one synthetic csdata table.
+
+    :param db_dir: String directory for the SQLite file.
+    :param num_rows: Int number of applicant rows.
+    :param num_schools: Int number of schools.
+    :param methods: List of chance_calc methods.
+    :param repeats: Int number of timed calls per benchmark.
+    :return: List of dicts containing benchmark results.
+    """
+    db_path = os.path.join(db_dir, "bench_" + str(num_rows) + "_" + str(num_schools) + ".db")
+    params = {"Rows": num_rows, "Schools": num_schools}
+    results = []
+
+    build = bench_time(lambda: synthetic_sqlite(db_path, num_rows, num_schools), 1)
+    results.append({"Name": "synthetic_csdata", "Params": params, "Seconds": build})
+
+    db_connection = sqlite_connect(db_path)
+    directory = school_directory_load(db_connection)
+    schools = [{'Name': school_data['School'], 'Rank': 50.0, 'PhD': 'Yes', 'MS': 'Yes', 'Backup': 'MS'}
+               for school_data in directory['Schools']]
+    num_programs = len(chance_query(db_connection, schools).fetchall())
+
+    results.append({"Name": "chance_query", "Params": dict(params, Programs=num_programs),
+                    "Seconds": bench_time(lambda: chance_query(db_connection, schools).fetchall(), repeats)})
+
+    for method in methods:
+        def run_chance_calc():
+            with contextlib.redirect_stdout(io.StringIO()):
+                chance_calc(db_connection, test_user_data(), [dict(school) for school in schools],
+                            method=method, seed=0)
+
+        seconds = bench_time(run_chance_calc, repeats)
+        results.append({"Name": "chance_calc", "Params": dict(params, Method=method, Programs=num_programs),
+                        "Seconds": seconds,
+                        "Seconds Per School": {key: value / max(num_programs, 1) for key, value in seconds.items()
+                                               if key != "Repeats"}})
+
+    results.append({"Name": "school_directory_load", "Params": params,
+                    "Seconds": bench_time(lambda: school_directory_load(db_connection), repeats)})
+
+    def run_lookups():
+        for school_query in LOOKUP_QUERIES:
+            school_directory_search(directory, school_query)
+
+    seconds = bench_time(run_lookups, repeats)
+    results.append({"Name": "school_data_in lookup", "Params": dict(params, Lookups=len(LOOKUP_QUERIES)),
+                    "Seconds": seconds,
+                    "Seconds Per Lookup": {key: value / len(LOOKUP_QUERIES) for key, value in seconds.items()
+                                           if key != "Repeats"}})
+
+    db_connection.close()
+    os.remove(db_path)
+
+    return results
+
+
+def bench_schools(num_schools, seed=0):
+    """Generates random schools with calculated chances to optimize.
+
+    :param num_schools: Int number of schools.
+    :param seed: Int seed of the generator.
+    :return: List of potential schools, with data and calculated chance.
+    """
+    generator = random.Random(seed)
+    schools = []
+
+    for number in range(num_schools):
+        phd = generator.random() < 0.7
+        school = {'Name': "School " + str(number), 'Rank': round(generator.uniform(40, 99), 1),
+                  'PhD': 'Yes' if phd else 'No', 'MS': 'Yes' if not phd or generator.random() < 0.5 else 'No'}
+        school['Backup'] = 'MS' if school['MS'] == 'Yes' else 'PhD'
+
+        if phd:
+            school['PhD Chance'] = generator.uniform(0.02, 0.5)
+        if school['MS'] == 'Yes':
+            school['MS Chance'] = generator.uniform(0.05, 0.8)
+
+        schools.append(school)
+
+    return schools
+
+
+def bench_optimize(sizes, methods, repeats):
+    """Benchmarks optimize_overall_calc and optimize_tier_calc.
+
+    :param sizes: List of (n, k) tuples, n schools with k applications.
+    :param methods: List of optimize_overall_calc methods.
+    :param repeats: Int number of timed calls per benchmark.
+    :return: List of dicts containing benchmark results.
+    """
+    results = []
+
+    for num_schools, num_apps in sizes:
+        schools = bench_schools(num_schools)
+        params = {'Chance Threshold': 0.99, 'Num Apps': num_apps, 'Chance Mod': 0.5, 'Threshold Mod': 0.9}
+
+        for method in methods:
+            if method in ("exhaustive", "parallel", "vectorized") and comb(num_schools, num_apps) > MAX_EXHAUSTIVE_COMBOS:
+                continue
+
+            results.append({"Name": "optimize_overall_calc",
+                            "Params": {"N": num_schools, "K": num_apps, "Method": method},
+                            "Seconds": bench_time(lambda: optimize_overall_calc(schools, dict(params), method=method),
+                                                  repeats)})
+
+        school_list_calcd = optimize_overall_calc(schools, dict(params))
+
+        if school_list_calcd['Best Score'] > 0:
+            results.append({"Name": "optimize_tier_calc", "Params": {"N": num_schools, "K": num_apps},
+                            "Seconds": bench_time(lambda: optimize_tier_calc(dict(school_list_calcd)), repeats)})
+
+    return results
+
+
+def bench_cold_start(modules, repeats, budget):
+    """Times importing modules in new Python processes.
+
+    Import time is measured inside each process, so interpreter startup is
+    excluded from it but included in 'Process Seconds'.
+
+    :param modules: List of module names in program/.
+    :param repeats: Int number of new processes per module.
+    :param budget: Float seconds allowed for a module's median import time.
+    :return: List of dicts containing benchmark results, with 'Over Budget'
+             true for modules over the budget or loading SciPy.
+    """
+    program_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program")
+    results = []
+
+    for module in modules:
+        code = "import sys, time\nstart = time.perf_counter()\nimport " + module \
+               + "\nprint(time.perf_counter() - start, 'scipy' in sys.modules)"
+        seconds = []
+        process_seconds = []
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", code], cwd=program_dir, capture_output=True, text=True,
+                                    check=True).stdout.split()
+            process_seconds.append(time.perf_counter() - start)
+            seconds.append(float(output[0]))
+            scipy_loaded = output[1] == "True"
+
+        results.append({"Name": "cold_start", "Params": {"Module": module, "Budget": budget},
+                        "Seconds": {"Min": min(seconds),
+                                    "Median": statistics.median(seconds),
+                                    "Mean": statistics.mean(seconds),
+                                    "Repeats": repeats},
+                        "Process Seconds": statistics.median(process_seconds),
+                        "SciPy Loaded": scipy_loaded,
+                        "Over Budget": statistics.median(seconds) > budget or scipy_loaded})
+
+    return results
+
+
+def bench_commit():
+    """Finds the git commit of the benchmarked code.
+
+    :return: String commit hash, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def _size_list(text):
+    return [tuple(int(value) for value in size.split(":")) for size in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the chance, school lookup, and optimization hot paths.")
+    parser.add_argument("--rows", type=_int_list, default=[10000, 100000],
+                        help="comma separated csdata row counts (i.e. 10000,1000000,10000000)")
+    parser.add_argument("--schools", type=_int_list, default=[10, 100],
+                        help="comma separated school counts (i.e. 10,100,500)")
+    parser.add_argument("--chance-methods", default="vectorized",
+                        help="comma separated chance_calc methods (i.e. vectorized,quadrature)")
+    parser.add_argument("--optimize", type=_size_list, default=[(16, 5), (24, 8), (40, 10), (60, 15)],
+                        help="comma separated n:k optimization sizes")
+    parser.add_argument("--optimize-methods", default="branch_and_bound,frontier,vectorized,exhaustive",
+                        help="comma separated optimize_overall_calc methods")
+    parser.add_argument("--repeats", type=int, default=3, help="timed calls per benchmark")
+    parser.add_argument("--cold-start-budget", type=float, default=DEFAULT_COLD_START_BUDGET,
+                        help="seconds allowed to import each entry point module")
+    parser.add_argument("--cold-start-only", action="store_true", help="only check the cold-start budget")
+    parser.add_argument("--db-dir", default=tempfile.gettempdir(), help="directory for the synthetic SQLite files")
+    parser.add_argument("--out", help="JSON results file (printed if not given)")
+    args = parser.parse_args()
+
+    bench_results = []
+
+    if not args.cold_start_only:
+        for rows in args.rows:
+            for num_schools_csdata in args.schools:
+                bench_results += bench_csdata(args.db_dir, rows, num_schools_csdata, args.chance_methods.split(","),
+                                              args.repeats)
+
+        bench_results += bench_optimize(args.optimize, args.optimize_methods.split(","), args.repeats)
+
+    cold_start_results = bench_cold_start(COLD_START_MODULES, max(args.repeats, 3), args.cold_start_budget)
+    bench_results += cold_start_results
+
+    report = json.dumps({"Commit": bench_commit(),
+                         "Time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                         "Python": platform.python_version(),
+                         "Platform": platform.platform(),
+                         "CPUs": os.cpu_count(),
+                         "Results": bench_results}, indent=2)
+
+    if args.out is None:
+        print(report)
+    else:
+        with open(args.out, 'w') as file_open:
+            file_open.write(report + "\n")
+
+    over_budget = [result for result in cold_start_results if result["Over Budget"]]
+
+    for result in over_budget:
+        print("Cold start over budget:", result["Params"]["Module"], round(result["Seconds"]["Median"], 3),
+              "seconds" + (", SciPy loaded" if result["SciPy Loaded"] else ""), file=sys.stderr)
+
+    if over_budget:
+        sys.exit(1)
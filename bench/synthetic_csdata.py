@@ -0,0 +1,129 @@
+"""Generates synthetic csdata tables for benchmarks.
+
+Schools get a random popularity (Zipf-like), acceptance rate, and applicant
+profile, so row counts, acceptance rates, and score distributions vary
+between schools like the scraped data. The first schools are the test
+schools of data/test_user_school_data.py, so the test profile and school
+list work against any synthetic table. Rows are generated and inserted in
+NumPy batches, so tables of tens of millions of rows fit in memory.
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program"),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")]
+
+from data.test_user_school_data import test_school_data  # noqa: E402
+from database import sqlite_connect  # noqa: E402
+from school_stats import school_stats_refresh  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEGREES = ("PhD", "MS", "MEng", "MFA", "Other")
+DEGREE_WEIGHTS = (0.45, 0.45, 0.05, 0.01, 0.04)
+
+STATUSES = ("Accepted", "Rejected", "Interview", "Wait listed", "Other")
+
+
+def synthetic_school_names(num_schools):
+    """Names synthetic schools, starting with the test schools.
+
+    :param num_schools: Int number of schools.
+    :return: List of string school names.
+    """
+    school_names = [school['Name'] for school in test_school_data()][:num_schools]
+
+    for number in range(len(school_names), num_schools):
+        school_names.append("Synthetic University " + str(number + 1) + " (SU" + str(number + 1) + ")")
+
+    return school_names
+
+
+def synthetic_csdata(db_connection, num_rows, num_schools, seed=0, batch_size=100000):
+    """Fills the csdata table with synthetic applicant rows.
+
+    Existing csdata rows are deleted, and school_stats is refreshed after.
+
+    :param db_connection: Database connection to csdata.
+    :param num_rows: Int number of applicant rows.
+    :param num_schools: Int number of schools.
+    :param seed: Int seed of the generator.
+    :param batch_size: Int number of rows generated and inserted per batch.
+    :return: List of string school names.
+    """
+    rng = np.random.default_rng(seed)
+    school_names = synthetic_school_names(num_schools)
+
+    popularity = 1 / np.arange(1, num_schools + 1) ** 0.8
+    popularity /= popularity.sum()
+    accept_rates = rng.uniform(0.05, 0.6, num_schools)
+    gpa_means = rng.uniform(3.3, 3.9, num_schools)
+    quant_means = rng.uniform(155, 168, num_schools)
+    verbal_means = rng.uniform(150, 162, num_schools)
+
+    cursor = db_connection.cursor()
+    cursor.execute("DELETE FROM csdata")
+    insert_query = "INSERT INTO csdata (School, Degree, Status, GPA, GREV, GREQ, GRET, GREAW) " \
+                   "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+
+    for start in range(0, num_rows, batch_size):
+        size = min(batch_size, num_rows - start)
+        schools = rng.choice(num_schools, size, p=popularity)
+        degrees = rng.choice(len(DEGREES), size, p=DEGREE_WEIGHTS)
+
+        accepted = rng.random(size) < accept_rates[schools]
+        other_status = rng.choice(np.arange(2, len(STATUSES)), size)
+        statuses = np.where(rng.random(size) < 0.8, np.where(accepted, 0, 1), other_status)
+
+        gpas = np.round(np.clip(rng.normal(gpa_means[schools] + 0.1 * accepted, 0.25), 2.0, 4.0), 2)
+        quants = np.round(np.clip(rng.normal(quant_means[schools] + 2 * accepted, 4), 130, 170))
+        verbals = np.round(np.clip(rng.normal(verbal_means[schools] + 2 * accepted, 6), 130, 170))
+        aws = np.clip(np.round(rng.normal(4, 0.6, size) * 2) / 2, 0, 6)
+        no_gpa = rng.random(size) < 0.1
+        no_gre = rng.random(size) < 0.2
+
+        rows = [(school_names[school], DEGREES[degree], STATUSES[status],
+                 None if missing_gpa else float(gpa),
+                 None if missing_gre else float(verbal),
+                 None if missing_gre else float(quant),
+                 None if missing_gre else float(verbal + quant),
+                 None if missing_gre else float(aw))
+                for school, degree, status, gpa, verbal, quant, aw, missing_gpa, missing_gre
+                in zip(schools, degrees, statuses, gpas, verbals, quants, aws, no_gpa, no_gre)]
+
+        cursor.executemany(insert_query, rows)
+        db_connection.commit()
+
+    cursor.close()
+    school_stats_refresh(db_connection)
+
+    return school_names
+
+
+def synthetic_sqlite(path, num_rows, num_schools, seed=0):
+    """Creates a SQLite csdata file of synthetic applicant rows.
+
+    :param path: String path to the SQLite file. Replaced if it exists.
+    :param num_rows: Int number of applicant rows.
+    :param num_schools: Int number of schools.
+    :param seed: Int seed of the generator.
+    :return: List of string school names.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    db_connection = sqlite_connect(path)
+    school_names = synthetic_csdata(db_connection, num_rows, num_schools, seed)
+    db_connection.close()
+
+    return school_names
@@ -0,0 +1,90 @@
+"""Incrementally refreshes csdata with new grad-cafe.com survey entries.
+
+The survey lists the newest entries first. Pages are scraped until one holds
+entries added before the csdata watermark (the newest date added already
+loaded, see Load.py), so only new pages are fetched. Entries already loaded
+are skipped by content hash, and only the school_stats rows of the schools
+and degrees that gained rows are rebuilt. A running school directory can be
+brought up to date with school_directory_update and the returned programs.
+
+Run this file for a nightly refresh.
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program"))
+
+from Load import load_csdata, load_page_paths, load_page_records, load_school_aliases, load_watermark  # noqa: E402
+from Scrape import DEFAULT_SURVEY_URL, scrape_since  # noqa: E402
+from database import DEFAULT_SQLITE_PATH, DatabaseError, mysql_connect, sqlite_connect  # noqa: E402
+from school_stats import school_stats_refresh  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEFAULT_INGEST_DIR = "./scraped/incremental/"
+
+
+def ingest_csdata(db_connection, survey_url=DEFAULT_SURVEY_URL, scrape_dir=DEFAULT_INGEST_DIR, concurrency=4,
+                  rate=1.0):
+    """Scrapes, loads and summarizes the survey entries newer than the watermark.
+
+    Without a watermark (nothing loaded yet) every page is scraped.
+
+    :param db_connection: Database connection to csdata.
+    :param survey_url: String survey URL, completed by the page number.
+    :param scrape_dir: String path for the scraped pages. Pages left by an
+                       earlier refresh are removed first.
+    :param concurrency: Int maximum number of requests in flight.
+    :param rate: Float maximum requests started per second (0 for no limit).
+    :return: Dict from load_csdata, with 'Pages', the int number of pages scraped.
+    """
+    watermark = load_watermark(db_connection)
+
+    def is_old(page_html):
+        added_dates = [added for _, added, _ in load_page_records(page_html, dict()) if added is not None]
+
+        if not added_dates:
+            return True
+
+        return watermark is not None and min(added_dates) < watermark
+
+    if os.path.isdir(scrape_dir):
+        for page_path in load_page_paths(scrape_dir):
+            os.remove(page_path)
+
+    pages = asyncio.run(scrape_since(is_old, survey_url, scrape_dir, concurrency, rate))
+
+    loaded = load_csdata(db_connection, load_page_paths(scrape_dir), aliases=load_school_aliases(db_connection))
+    loaded["Pages"] = len(pages)
+
+    if loaded["Programs"]:
+        school_stats_refresh(db_connection, loaded["Programs"])
+
+    return loaded
+
+
+if __name__ == "__main__":
+    try:
+        if os.path.exists(DEFAULT_SQLITE_PATH):
+            conn = sqlite_connect(DEFAULT_SQLITE_PATH)
+        else:
+            conn = mysql_connect(input("Please enter the root user MySQL password: "))
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+
+    else:
+        ingested = ingest_csdata(conn)
+        print("Scraped", ingested["Pages"], "pages and loaded", ingested["Rows"], "new rows for",
+              len(ingested["Programs"]), "school and degree types (watermark " + str(ingested["Watermark"]) + ").")
+        conn.close()
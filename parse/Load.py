@@ -0,0 +1,442 @@
+"""Parses scraped grad-cafe.com survey pages and bulk loads them into csdata.
+
+Pages written by Scrape.py (./scraped/<page>.html) are parsed in a process
+pool with the standard library HTML parser. Each survey row is normalized to
+the csdata columns School, Degree, Status, GPA, GREV, GREQ, GRET and GREAW:
+    - School names are canonicalized to the names already in csdata, i.e.
+      "MIT" or "massachusetts institute of technology" become
+      "Massachusetts Institute Of Technology (MIT)".
+    - Degrees come from the program (i.e. "Computer Science, PhD (F17)"),
+      with variants like "Masters" or "M.S." normalized to "MS" or "PhD".
+      Rows of any other degree are skipped and counted.
+    - GPAs outside 0-4 and GRE scores outside the current scales are dropped.
+    - GRET is the combined Verbal and Quant score.
+Only a bounded window of pages is in flight and rows are inserted in batches
+with executemany, so memory use does not grow with the number of pages.
+
+Survey entries are deduplicated by a hash of their content, kept in the
+csdata_hash table, so pages can be loaded more than once. The newest "Date
+Added" loaded is stored as a high-water mark in the csdata_ingest table (see
+Ingest.py for incremental refreshes).
+
+Run this file to load every scraped page and refresh school_stats.
+"""
+
+import hashlib
+import os
+import re
+import string
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program"))
+
+from database import DEFAULT_SQLITE_PATH, DatabaseError, mysql_connect, sqlite_connect  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEFAULT_SCRAPE_DIR = "./scraped/"
+
+LOAD_COLUMNS = ("School", "Degree", "Status", "GPA", "GREV", "GREQ", "GRET", "GREAW")
+
+STATUSES = ("Accepted", "Rejected", "Wait listed", "Interview", "Other")
+
+# Degree variants, lowercase without punctuation or spaces, and the csdata degree they are loaded as.
+DEGREE_ALIASES = {"ms": "MS", "msc": "MS", "mscs": "MS", "mcs": "MS", "master": "MS", "masters": "MS",
+                  "masterofscience": "MS", "mastersofscience": "MS", "masterofcomputerscience": "MS",
+                  "phd": "PhD", "dphil": "PhD", "doctorate": "PhD", "doctoral": "PhD", "doctorofphilosophy": "PhD"}
+
+# Common name variants not derivable from the names in csdata.
+SCHOOL_ALIASES = {"carnegie mellon": "Carnegie Mellon University (CMU)",
+                  "university of michigan": "University Of Michigan, Ann Arbor (UMich)",
+                  "michigan": "University Of Michigan, Ann Arbor (UMich)",
+                  "maryland": "University Of Maryland, College Park (UMD)",
+                  "mcgill": "McGill University",
+                  "rutgers": "Rutgers University"}
+
+_load_aliases = None
+
+
+class SurveyTableParser(HTMLParser):
+    """Collects the text of every table cell, row by row."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+        elif tag == "br" and self._cell is not None:
+            self._cell.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def load_school_aliases(db_connection):
+    """Maps normalized school name variants to the school names in csdata.
+
+    Each csdata name is keyed by its full name, its name without the
+    parenthesized abbreviation, and the abbreviation itself (or each of
+    several abbreviations, i.e. "UC San Diego-UCSD"). More prevalent
+    schools win ties. SCHOOL_ALIASES fills in the remaining variants.
+
+    :param db_connection: Database connection to csdata.
+    :return: Dict of canonical school names keyed by normalized variant.
+    """
+    cursor = db_connection.cursor()
+    cursor.execute("SELECT School FROM csdata GROUP BY School ORDER BY COUNT(*) DESC")
+    aliases = dict()
+
+    for (school_name,) in cursor.fetchall():
+        abbreviation = re.search(r"\(([^)]*)\)\s*$", school_name)
+        variants = [school_name, re.sub(r"\([^)]*\)\s*$", "", school_name)]
+
+        if abbreviation:
+            variants += [abbreviation.group(1)] + abbreviation.group(1).split("-")
+
+        for variant in variants:
+            aliases.setdefault(_school_key(variant), school_name)
+
+    cursor.close()
+
+    for variant, school_name in SCHOOL_ALIASES.items():
+        aliases.setdefault(_school_key(variant), school_name)
+
+    return aliases
+
+
+def load_school_name(raw_name, aliases):
+    """Canonicalizes a school name.
+
+    :param raw_name: String school name, as entered in the survey.
+    :param aliases: Dict from load_school_aliases.
+    :return: String canonical school name. Unknown schools are title cased.
+    """
+    return aliases.get(_school_key(raw_name), string.capwords(" ".join(raw_name.split())))
+
+
+def load_page(page_path):
+    """Parses one scraped survey page into csdata records.
+
+    :param page_path: String path to a scraped page.
+    :return: List of records from load_page_records.
+    """
+    with open(page_path, encoding='UTF-8', errors='replace') as file_open:
+        return load_page_records(file_open.read(), _load_aliases or dict())
+
+
+def load_page_records(page_html, aliases):
+    """Parses survey page HTML into csdata records.
+
+    Each record is a tuple of:
+        - Content hash of the survey entry's cells
+        - Date added as an ISO date string (None if missing)
+        - csdata row tuple, in LOAD_COLUMNS order
+
+    :param page_html: String containing survey page HTML.
+    :param aliases: Dict from load_school_aliases.
+    :return: List of csdata records.
+    """
+    parser = SurveyTableParser()
+    parser.feed(page_html)
+    parser.close()
+    records = []
+
+    for cells in parser.rows:
+        if len(cells) < 3 or not cells[0] or cells[0] == "Institution":
+            continue
+
+        row = load_row(cells[0], cells[1], cells[2], aliases)
+
+        if row is not None:
+            content_hash = hashlib.sha256("\x1f".join(cells).encode('UTF-8')).hexdigest()
+            records.append((content_hash, _added_date(cells[4] if len(cells) > 4 else ""), row))
+
+    return records
+
+
+def load_row(institution, program, decision, aliases):
+    """Normalizes one survey row.
+
+    Example:
+        Institution: MIT
+        Program: Computer Science, PhD (F17)
+        Decision: Accepted via E-mail on 15 Feb 2017 Undergrad GPA: 3.89
+            GRE General (V/Q/W): 165/168/4.50 GRE Subject: n/a
+        Row: ('Massachusetts Institute Of Technology (MIT)', 'PhD', 'Accepted', 3.89, 165.0, 168.0, 333.0, 4.5)
+
+    :param institution: String institution cell.
+    :param program: String program cell.
+    :param decision: String decision cell, including the applicant details.
+    :param aliases: Dict from load_school_aliases.
+    :return: csdata row tuple in LOAD_COLUMNS order, with a Degree of None if
+             the degree is neither an MS nor a PhD (see load_degree), or None
+             if not a survey row.
+    """
+    status = re.match(r"\s*(" + "|".join(STATUSES) + ")", decision, re.IGNORECASE)
+
+    if status is None:
+        return None
+
+    status = [known for known in STATUSES if known.lower() == status.group(1).lower()][0]
+
+    degree = load_degree(program)
+
+    gpa = re.search(r"GPA\s*:\s*(\d+(?:\.\d+)?)", decision)
+    gpa = _value_in_range(gpa and gpa.group(1), 0, 4)
+
+    gre = re.search(r"GRE General \(V/Q/W\)\s*:\s*([\d.]+)\s*/\s*([\d.]+)\s*/\s*([\d.]+)", decision)
+
+    if gre:
+        verbal = _value_in_range(gre.group(1), 130, 170)
+        quant = _value_in_range(gre.group(2), 130, 170)
+        analytical_writing = _value_in_range(gre.group(3), 0, 6)
+    else:
+        verbal = quant = analytical_writing = None
+
+    if verbal is not None and quant is not None:
+        combined = verbal + quant
+    else:
+        combined = None
+
+    return (load_school_name(institution, aliases), degree, status, gpa, verbal, quant, combined,
+            analytical_writing)
+
+
+def load_degree(program):
+    """Normalizes the degree of a program cell.
+
+    Example:
+        Program: Computer Science, Masters (F17)
+        Degree: MS
+
+    :param program: String program cell.
+    :return: String degree, "MS" or "PhD", or None for any other degree.
+    """
+    degree = re.sub(r"\([^)]*\)\s*$", "", program).rsplit(",", 1)[-1]
+
+    return DEGREE_ALIASES.get(re.sub(r"[^a-z]", "", degree.lower()))
+
+
+def load_csdata(db_connection, page_paths, workers=None, batch_size=10000, aliases=None):
+    """Parses scraped pages in a process pool and bulk inserts their rows.
+
+    Pages are handed out in order, with at most 2 per worker in flight, and
+    each batch of rows is committed once inserted. Entries already loaded
+    (by content hash) are skipped, and the watermark is advanced to the
+    newest date added. Rows of degrees other than MS and PhD are skipped and
+    counted, and not marked as loaded.
+
+    :param db_connection: Database connection to csdata.
+    :param page_paths: Iterable of string paths to scraped pages.
+    :param workers: Int number of worker processes. Defaults to the number of CPUs.
+    :param batch_size: Int number of rows inserted per executemany.
+    :param aliases: Dict from load_school_aliases. Loaded from db_connection
+                    if not given.
+    :return: Dict with 'Rows', the int number of rows inserted, 'Programs',
+             the set of (School, Degree) tuples that gained rows, 'Skipped
+             Degrees', the int number of rows skipped for their degree, and
+             'Watermark', the newest date added (ISO string or None).
+    """
+    ingest_create(db_connection)
+
+    if aliases is None:
+        aliases = load_school_aliases(db_connection)
+
+    workers = workers or os.cpu_count() or 1
+    loaded = {"Rows": 0, "Programs": set(), "Skipped Degrees": 0, "Watermark": load_watermark(db_connection)}
+    batch = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_init, initargs=(aliases,)) as executor:
+        pending = deque()
+
+        for page_path in page_paths:
+            pending.append(executor.submit(load_page, page_path))
+
+            if len(pending) >= workers * 2:
+                batch += pending.popleft().result()
+
+            if len(batch) >= batch_size:
+                _load_batch(db_connection, batch, loaded)
+                batch = []
+
+        while pending:
+            batch += pending.popleft().result()
+
+            if len(batch) >= batch_size:
+                _load_batch(db_connection, batch, loaded)
+                batch = []
+
+    if batch:
+        _load_batch(db_connection, batch, loaded)
+
+    return loaded
+
+
+def ingest_create(db_connection):
+    """Creates the csdata_ingest and csdata_hash tables if they do not exist.
+
+    :param db_connection: Database connection to csdata.
+    :return:
+    """
+    cursor = db_connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS csdata_ingest (
+            Name VARCHAR(64) NOT NULL PRIMARY KEY,
+            Value VARCHAR(255)
+        )
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS csdata_hash (
+            Hash CHAR(64) NOT NULL PRIMARY KEY
+        )
+        """)
+    cursor.close()
+
+
+def load_watermark(db_connection):
+    """Reads the newest date added loaded into csdata.
+
+    :param db_connection: Database connection to csdata.
+    :return: ISO date string, or None if nothing was loaded.
+    """
+    ingest_create(db_connection)
+
+    cursor = db_connection.cursor()
+    cursor.execute("SELECT Value FROM csdata_ingest WHERE Name = %s", ["Watermark"])
+    row = cursor.fetchone()
+    cursor.close()
+
+    if row is None:
+        return None
+
+    return row[0]
+
+
+def load_page_paths(scrape_dir=DEFAULT_SCRAPE_DIR):
+    """Lists scraped pages in page order.
+
+    :param scrape_dir: String path to the scraped pages.
+    :return: List of string paths to scraped pages.
+    """
+    page_names = [name for name in os.listdir(scrape_dir) if re.fullmatch(r"\d+\.html", name)]
+
+    return [os.path.join(scrape_dir, name) for name in sorted(page_names, key=lambda name: int(name[:-5]))]
+
+
+def _load_init(aliases):
+    global _load_aliases
+    _load_aliases = aliases
+
+
+def _load_batch(db_connection, batch, loaded):
+    cursor = db_connection.cursor()
+    batch_hashes = list({content_hash for content_hash, _, _ in batch})
+    known_hashes = set()
+
+    for start in range(0, len(batch_hashes), 500):
+        hashes = batch_hashes[start:start + 500]
+        cursor.execute("SELECT Hash FROM csdata_hash WHERE Hash IN (" + ", ".join(["%s"] * len(hashes)) + ")",
+                       hashes)
+        known_hashes.update(row[0] for row in cursor.fetchall())
+
+    rows = []
+    new_hashes = []
+
+    for content_hash, added, row in batch:
+        if row[1] is None:
+            loaded["Skipped Degrees"] += 1
+        elif content_hash not in known_hashes:
+            known_hashes.add(content_hash)
+            new_hashes.append([content_hash])
+            rows.append(row)
+            loaded["Programs"].add((row[0], row[1]))
+
+            if added is not None and (loaded["Watermark"] is None or added > loaded["Watermark"]):
+                loaded["Watermark"] = added
+
+    cursor.executemany("INSERT INTO csdata (" + ", ".join(LOAD_COLUMNS) + ") VALUES ("
+                       + ", ".join(["%s"] * len(LOAD_COLUMNS)) + ")", rows)
+    cursor.executemany("INSERT INTO csdata_hash (Hash) VALUES (%s)", new_hashes)
+    cursor.execute("DELETE FROM csdata_ingest WHERE Name = %s", ["Watermark"])
+    cursor.execute("INSERT INTO csdata_ingest (Name, Value) VALUES (%s, %s)", ["Watermark", loaded["Watermark"]])
+    cursor.close()
+
+    db_connection.commit()
+    loaded["Rows"] += len(rows)
+
+
+def _added_date(added):
+    try:
+        return datetime.strptime(added.strip(), "%d %b %Y").date().isoformat()
+    except ValueError:
+        return None
+
+
+def _school_key(school_name):
+    school_key = school_name.lower().replace("&", " and ")
+    school_key = re.sub(r"[^a-z0-9 ]", " ", school_key)
+    school_key = " ".join(school_key.split())
+
+    if school_key.startswith("the "):
+        school_key = school_key[4:]
+
+    return school_key
+
+
+def _value_in_range(value, low, high):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    if low <= value <= high:
+        return value
+
+    return None
+
+
+if __name__ == "__main__":
+    from school_stats import school_stats_refresh
+
+    try:
+        if os.path.exists(DEFAULT_SQLITE_PATH):
+            conn = sqlite_connect(DEFAULT_SQLITE_PATH)
+        else:
+            conn = mysql_connect(input("Please enter the root user MySQL password: "))
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+
+    else:
+        csdata_loaded = load_csdata(conn, load_page_paths())
+        print("Loaded", csdata_loaded["Rows"], "new rows into csdata, skipping", csdata_loaded["Skipped Degrees"],
+              "rows of other degrees.")
+        print("Refreshed school_stats with", school_stats_refresh(conn), "school and degree rows.")
+        conn.close()
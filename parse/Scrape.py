@@ -1,8 +1,25 @@
 """Scrapes computer science data from grad-cafe.com
 
-Credit to Debarghya Das for the idea. https://github.com/deedy/gradcafe_data"""
+Credit to Debarghya Das for the idea. https://github.com/deedy/gradcafe_data
 
-import requests
+Survey pages are fetched concurrently over one pooled aiohttp session. A
+rate limiter spaces out requests, failed requests are retried with
+exponential backoff, and the last page is discovered from the pagination
+links of page 1. Finished pages are recorded in a checkpoint file, so an
+interrupted crawl resumes where it stopped. The survey URL can point at any
+server (i.e. a local stand-in for testing). scrape_since fetches only the
+newest pages, for incremental refreshes (see Ingest.py).
+
+Run this file to scrape every page into ./scraped/<page>.html.
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
 
 __author__ = "Jacob Lydon"
 __copyright__ = "Copyright 2017"
@@ -14,11 +31,251 @@ __maintainer__ = "Jacob Lydon"
 __email__ = "jlydon001@regis.edu"
 __status__ = "Development"
 
-num_pages = 2
+DEFAULT_SURVEY_URL = os.environ.get(
+    "GRADCAFE_URL", """http://thegradcafe.com/survey/index.php?q="computer+science"&t=a&pp=250&o=d&p=""")
+DEFAULT_SCRAPE_DIR = "./scraped/"
+CHECKPOINT_FILE = "checkpoint.json"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Spaces the start of requests at least 1 / rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._lock = asyncio.Lock()
+        self._next_time = 0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_time - loop.time()
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self._next_time = max(self._next_time, loop.time()) + self.interval
+
+
+def scrape_last_page(page_html):
+    """Finds the last survey page from the pagination links of a page.
+
+    :param page_html: String containing survey page HTML.
+    :return: Int number of the last page (1 without pagination links).
+    """
+    return max([int(page) for page in re.findall(r"[?&;]p=(\d+)", page_html)] + [1])
+
+
+def scrape_checkpoint_load(scrape_dir):
+    """Loads the crawl checkpoint of a scrape directory.
+
+    Pages are only counted as done when their file still exists.
+
+    :param scrape_dir: String path to the scraped pages.
+    :return: Dict with 'Last Page', an int or None, and 'Done', a set of ints.
+    """
+    checkpoint = {"Last Page": None, "Done": set()}
+    checkpoint_path = os.path.join(scrape_dir, CHECKPOINT_FILE)
+
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as file_open:
+            saved = json.load(file_open)
+
+        checkpoint["Last Page"] = saved.get("Last Page")
+        checkpoint["Done"] = {page for page in saved.get("Done", [])
+                              if os.path.exists(os.path.join(scrape_dir, str(page) + ".html"))}
+
+    return checkpoint
+
+
+def scrape_checkpoint_save(scrape_dir, checkpoint):
+    """Atomically writes the crawl checkpoint of a scrape directory.
+
+    :param scrape_dir: String path to the scraped pages.
+    :param checkpoint: Dict containing the crawl checkpoint.
+    :return:
+    """
+    checkpoint_path = os.path.join(scrape_dir, CHECKPOINT_FILE)
+
+    with open(checkpoint_path + ".tmp", 'w') as file_open:
+        json.dump({"Last Page": checkpoint["Last Page"], "Done": sorted(checkpoint["Done"])}, file_open)
+
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+async def scrape_page(session, limiter, survey_url, page, retries=5, backoff=1.0):
+    """Fetches one survey page, retrying failed requests.
+
+    Connection errors, timeouts and retryable statuses are retried after
+    backoff * 2 ** attempt seconds (with jitter), or the server's Retry-After.
+
+    :param session: aiohttp ClientSession.
+    :param limiter: RateLimiter shared by all requests.
+    :param survey_url: String survey URL, completed by the page number.
+    :param page: Int page number.
+    :param retries: Int number of retries before giving up.
+    :param backoff: Float base backoff delay in seconds.
+    :return: String containing the page HTML.
+    """
+    for attempt in range(retries + 1):
+        await limiter.wait()
+        retry_after = None
+
+        try:
+            async with session.get(survey_url + str(page)) as response:
+                if response.status not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return await response.text()
+
+                retry_after = response.headers.get("Retry-After")
+                error = aiohttp.ClientResponseError(response.request_info, response.history,
+                                                    status=response.status, message=response.reason)
+
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            error = e
+
+        if attempt == retries:
+            raise error
+
+        if retry_after is not None and retry_after.isdigit():
+            await asyncio.sleep(int(retry_after))
+        else:
+            await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def scrape_page_save(scrape_dir, page, page_html):
+    """Atomically writes a survey page to <scrape_dir>/<page>.html.
+
+    :param scrape_dir: String path to the scraped pages.
+    :param page: Int page number.
+    :param page_html: String containing the page HTML.
+    :return:
+    """
+    page_path = os.path.join(scrape_dir, str(page) + ".html")
+
+    with open(page_path + ".tmp", 'wb') as file_open:
+        file_open.write(page_html.encode('UTF-8'))
+
+    os.replace(page_path + ".tmp", page_path)
+
+
+async def scrape_survey(survey_url=DEFAULT_SURVEY_URL, scrape_dir=DEFAULT_SCRAPE_DIR, concurrency=4, rate=1.0,
+                        last_page=None, retries=5, backoff=1.0):
+    """Scrapes every survey page not yet recorded in the checkpoint.
+
+    :param survey_url: String survey URL, completed by the page number.
+    :param scrape_dir: String path to the scraped pages.
+    :param concurrency: Int maximum number of requests in flight.
+    :param rate: Float maximum requests started per second (0 for no limit).
+    :param last_page: Optional int last page. Discovered from page 1 (or the
+                      checkpoint) if not given.
+    :param retries: Int number of retries per page.
+    :param backoff: Float base backoff delay in seconds.
+    :return: List of int page numbers scraped by this call.
+    """
+    os.makedirs(scrape_dir, exist_ok=True)
+    checkpoint = scrape_checkpoint_load(scrape_dir)
+    limiter = RateLimiter(rate)
+    scraped_pages = []
+
+    if last_page is not None:
+        checkpoint["Last Page"] = last_page
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers={'User-Agent': 'Mozilla/5.0'}) as session:
+        if checkpoint["Last Page"] is None or 1 not in checkpoint["Done"]:
+            page_html = await scrape_page(session, limiter, survey_url, 1, retries, backoff)
+            scrape_page_save(scrape_dir, 1, page_html)
+
+            if checkpoint["Last Page"] is None:
+                checkpoint["Last Page"] = scrape_last_page(page_html)
+
+            checkpoint["Done"].add(1)
+            scraped_pages.append(1)
+            scrape_checkpoint_save(scrape_dir, checkpoint)
+
+        queue = asyncio.Queue()
+
+        for page in range(1, checkpoint["Last Page"] + 1):
+            if page not in checkpoint["Done"]:
+                queue.put_nowait(page)
+
+        async def worker():
+            while not queue.empty():
+                page = queue.get_nowait()
+                scrape_page_save(scrape_dir, page, await scrape_page(session, limiter, survey_url, page, retries,
+                                                                     backoff))
+                checkpoint["Done"].add(page)
+                scraped_pages.append(page)
+                scrape_checkpoint_save(scrape_dir, checkpoint)
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    return sorted(scraped_pages)
+
+
+async def scrape_since(is_old, survey_url=DEFAULT_SURVEY_URL, scrape_dir=DEFAULT_SCRAPE_DIR, concurrency=4, rate=1.0,
+                       retries=5, backoff=1.0):
+    """Scrapes survey pages, newest first, until a page reaches old entries.
+
+    Page 1 is fetched first, to find the last page, then later pages are
+    fetched in windows of concurrency pages. The crawl stops after the
+    window holding the first page for which is_old is true, or the last
+    page. No checkpoint is kept, since only a few pages are fetched.
+
+    :param is_old: Function of a page's HTML, true once the page holds
+                   entries that were already loaded.
+    :param survey_url: String survey URL, completed by the page number.
+    :param scrape_dir: String path for the scraped pages.
+    :param concurrency: Int maximum number of requests in flight.
+    :param rate: Float maximum requests started per second (0 for no limit).
+    :param retries: Int number of retries per page.
+    :param backoff: Float base backoff delay in seconds.
+    :return: List of int page numbers scraped.
+    """
+    os.makedirs(scrape_dir, exist_ok=True)
+    limiter = RateLimiter(rate)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers={'User-Agent': 'Mozilla/5.0'}) as session:
+        # Page 1 is fetched alone, so every window is capped at the last page.
+        page_html = await scrape_page(session, limiter, survey_url, 1, retries, backoff)
+        scrape_page_save(scrape_dir, 1, page_html)
+        last_page = scrape_last_page(page_html)
+        page = 2
+
+        if is_old(page_html):
+            return [1]
+
+        while page <= last_page:
+            pages = range(page, min(page + concurrency, last_page + 1))
+            pages_html = await asyncio.gather(*[scrape_page(session, limiter, survey_url, window_page, retries,
+                                                            backoff) for window_page in pages])
+
+            for window_page, page_html in zip(pages, pages_html):
+                scrape_page_save(scrape_dir, window_page, page_html)
+
+            page = pages[-1] + 1
+
+            if any(is_old(page_html) for page_html in pages_html):
+                break
+
+    return list(range(1, page))
+
 
-for page in range(1, 2):
-    retrieved_data = requests.get("""http://thegradcafe.com/survey/index.php?q="computer+science"&t=a&pp=250&o=d&p="""
-                                  + str(page), headers={'User-Agent': 'Mozilla/5.0'})
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrapes computer science survey pages from grad-cafe.com.")
+    parser.add_argument("--url", default=DEFAULT_SURVEY_URL, help="survey URL, completed by the page number")
+    parser.add_argument("--out", default=DEFAULT_SCRAPE_DIR, help="directory for scraped pages and the checkpoint")
+    parser.add_argument("--concurrency", type=int, default=4, help="maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=1.0, help="maximum requests per second (0 for no limit)")
+    parser.add_argument("--last-page", type=int, help="last page to scrape (discovered if not given)")
+    args = parser.parse_args()
 
-    with open("./scraped/" + str(page) + ".html", 'wb') as file_open:
-        file_open.write(retrieved_data.text.encode('UTF-8'))
+    pages = asyncio.run(scrape_survey(args.url, args.out, args.concurrency, args.rate, args.last_page))
+    print("Scraped", len(pages), "pages into", args.out)
@@ -0,0 +1,314 @@
+"""Scores and optimizes school lists for many students without prompts.
+
+The batch equivalent of main.py, for cohort-sized overnight jobs:
+1.  Student profiles are read from a JSON list, JSON lines, or CSV file, with
+    the keys of user_data_in and an optional 'ID'.
+2.  One school list (Name, Rank, PhD, MS, Backup, as in school_data_in) is
+    read from a JSON or CSV file and shared by every student. Names are
+    resolved against the school directory, like school_data_in.
+3.  Optimization parameters (as in optimize_input) are read from a JSON file
+    or given as options.
+4.  Profiles are scored in chunks with chance_matrix, over one data
+    connection and school statistics queried once, then each student's list
+    is optimized with optimize_overall_calc.
+One JSON line is written per student, in input order, as soon as its chunk
+is done. Invalid profiles get an 'Error' line and do not stop the job.
+
+Run this file with --help for the options.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from itertools import islice
+import numpy as np
+from chance import chance_matrix
+from chance_cache import USER_DATA_KEYS
+from columnar import columnar_open
+from database import DEFAULT_SQLITE_PATH, DatabaseError, mysql_connect, sqlite_connect
+from optimize import optimize_overall_calc
+from school_directory import school_directory_load, school_directory_resolve
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+# Allowed range of each profile value, as in user_data_in.
+PROFILE_RANGES = {'GPA': (0.0, 4.0), 'Other GPA': (0.0, 4.0), 'Quant': (130, 170), 'Verbal': (130, 170),
+                  'AW': (0.0, 6.0), 'LOR High': (0, 100), 'LOR Low': (0, 100), 'Research High': (0, 100),
+                  'Research Low': (0, 100), 'SOP High': (0, 100), 'SOP Low': (0, 100)}
+
+DEFAULT_PARAMS = {'Chance Threshold': 0.99, 'Num Apps': 8, 'Chance Mod': 0.5, 'Threshold Mod': 0.9}
+
+
+def batch_read(path):
+    """Reads records from a JSON list, JSON lines, or CSV file.
+
+    Files ending in .csv are read as CSV with a header row, .jsonl files as
+    one JSON object per line, and any other file as a JSON list (or a single
+    JSON object). JSON lines and CSV records are read lazily.
+
+    :param path: String path to the file.
+    :return: Iterator of dicts.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    with open(path, newline='' if extension == ".csv" else None, encoding='UTF-8') as file_open:
+        if extension == ".csv":
+            yield from csv.DictReader(file_open)
+        elif extension == ".jsonl":
+            for line in file_open:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            records = json.load(file_open)
+            yield from records if isinstance(records, list) else [records]
+
+
+def batch_profile(record, number):
+    """Validates and converts one student profile record.
+
+    :param record: Dict read by batch_read.
+    :param number: Int position of the record, used as its ID if it has none.
+    :return: Tuple of the ID and a dict of student profile data, keyed as in
+             user_data_in.
+    """
+    profile_id = record.get('ID') or number
+    user_data = dict()
+
+    for key in USER_DATA_KEYS:
+        low, high = PROFILE_RANGES[key]
+
+        try:
+            value = float(record[key])
+        except KeyError:
+            raise ValueError("Missing " + key) from None
+        except (TypeError, ValueError):
+            raise ValueError(key + " is not a number: " + repr(record[key])) from None
+
+        if not low <= value <= high:
+            raise ValueError(key + " must be between " + str(low) + " and " + str(high))
+
+        user_data[key] = value
+
+    for key in ('LOR', 'Research', 'SOP'):
+        if user_data[key + ' Low'] >= user_data[key + ' High']:
+            raise ValueError(key + " Low must be lower than " + key + " High")
+
+    return profile_id, user_data
+
+
+def batch_schools(records, directory):
+    """Converts school list records and resolves their names.
+
+    :param records: Iterable of dicts with 'Name', 'Rank', 'PhD', 'MS', and
+                    optional 'Backup'.
+    :param directory: Dict containing the school directory.
+    :return: Tuple of the list of potential schools, and a list of names
+             that matched no school.
+    """
+    records = list(records)
+    resolved = school_directory_resolve(directory, [record['Name'] for record in records])
+    schools = []
+    unknown = []
+
+    for record, school_data in zip(records, resolved):
+        if school_data is None:
+            unknown.append(record['Name'])
+            continue
+
+        school = {'Name': school_data['School'],
+                  'Rank': float(record['Rank']),
+                  'PhD': _yes_no(record.get('PhD', "Yes")),
+                  'MS': _yes_no(record.get('MS', "No"))}
+        school['Backup'] = record.get('Backup') or ("MS" if school['MS'] == "Yes" else "PhD")
+        schools.append(school)
+
+    return schools, unknown
+
+
+def batch_params(path=None, **overrides):
+    """Collects optimization parameters.
+
+    :param path: Optional string path to a JSON file of parameters.
+    :param overrides: Parameters given as options, keyed as in optimize_input.
+                      None values are ignored.
+    :return: Dict with optimization parameters.
+    """
+    params = dict(DEFAULT_PARAMS)
+
+    if path is not None:
+        with open(path, encoding='UTF-8') as file_open:
+            params.update(json.load(file_open))
+
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    params['Num Apps'] = int(params['Num Apps'])
+
+    for key in ('Chance Threshold', 'Chance Mod', 'Threshold Mod'):
+        params[key] = float(params[key])
+
+    return params
+
+
+def batch_score(db_connection, profile_records, schools, params, chunk_size=256, instances=1000, seed=None,
+                method="branch_and_bound"):
+    """Scores and optimizes a school list for each student profile.
+
+    School statistics are queried on the first chunk and reused after.
+    Degrees without data are left out of a student's list, and reported in
+    its 'No Data'.
+
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
+    :param profile_records: Iterable of student profile dicts.
+    :param schools: List of potential schools.
+    :param params: Dict with optimization parameters.
+    :param chunk_size: Int number of profiles scored together.
+    :param instances: Int number of simulated student profile instances.
+    :param seed: Optional int seed, for results repeatable with the same
+                 chunk_size.
+    :param method: optimize_overall_calc search method.
+    :return: Iterator of result dicts, one per profile, with 'ID' and either
+             'Chances' and 'Optimized', or 'Error'.
+    """
+    rng = np.random.default_rng(seed)
+    records = enumerate(profile_records, 1)
+    school_rows = None
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+
+        if not chunk:
+            break
+
+        results = []
+        profiles = []
+
+        for number, record in chunk:
+            try:
+                profile_id, user_data = batch_profile(record, number)
+            except ValueError as e:
+                results.append({"ID": record.get('ID') or number, "Error": str(e)})
+            else:
+                results.append({"ID": profile_id})
+                profiles.append(user_data)
+
+        matrix = chance_matrix(db_connection, profiles, schools, instances, rng, school_rows)
+        school_rows = matrix["School Data"]
+        profile_chances = iter(matrix["Chances"])
+
+        for result in results:
+            if "Error" not in result:
+                scored = batch_school_chances(schools, matrix["Programs"], next(profile_chances))
+                result.update({"Chances": scored["Chances"],
+                               "No Data": scored["No Data"],
+                               "Optimized": optimize_overall_calc(scored["Schools"], dict(params), method=method)})
+
+            yield result
+
+
+def batch_school_chances(schools, programs, chances):
+    """Sets one student's chances on copies of the potential schools.
+
+    Degrees without data are set to "No", and schools left without a degree
+    are dropped, so the schools can be passed to optimize_overall_calc.
+
+    :param schools: List of potential schools.
+    :param programs: List of (School, Degree) tuples, from chance_matrix.
+    :param chances: Array of the student's chance (0 to 1) of each program.
+    :return: Dict with 'Schools', the potential schools with calculated
+             chances, 'Chances', a list of dicts of each school, degree and
+             chance, and 'No Data', a list of dicts of each school and degree
+             without data.
+    """
+    columns = {program: column for column, program in enumerate(programs)}
+    schools_consider = []
+    school_chances = []
+    no_data = []
+
+    for school in schools:
+        school = dict(school)
+
+        for degree in ("PhD", "MS"):
+            if school[degree] != "Yes":
+                continue
+
+            column = columns.get((school['Name'], degree))
+
+            if column is None:
+                school[degree] = "No"
+                no_data.append({"School": school['Name'], "Degree": degree})
+            else:
+                school[degree + " Chance"] = float(chances[column])
+                school_chances.append({"School": school['Name'], "Degree": degree, "Chance": float(chances[column])})
+
+        if school['PhD'] == "Yes" or school['MS'] == "Yes":
+            schools_consider.append(school)
+
+    return {"Schools": schools_consider, "Chances": school_chances, "No Data": no_data}
+
+
+def _yes_no(value):
+    return "Yes" if str(value).strip().lower() in ("yes", "y", "true", "1") else "No"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scores and optimizes school lists for many students, "
+                                                 "writing one JSON line per student.")
+    parser.add_argument("profiles", help="student profiles (.json, .jsonl, or .csv)")
+    parser.add_argument("schools", help="school list (.json or .csv)")
+    parser.add_argument("--params", help="JSON file of optimization parameters")
+    parser.add_argument("--chance-threshold", type=float)
+    parser.add_argument("--num-apps", type=int)
+    parser.add_argument("--chance-mod", type=float)
+    parser.add_argument("--threshold-mod", type=float)
+    parser.add_argument("--method", default="branch_and_bound", help="optimize_overall_calc search method")
+    parser.add_argument("--db", default=DEFAULT_SQLITE_PATH, help="SQLite csdata file")
+    parser.add_argument("--columnar", help="columnar store directory, used in place of --db")
+    parser.add_argument("--mysql", action="store_true",
+                        help="use the MySQL database, with the password in CSDATA_MYSQL_PASSWORD")
+    parser.add_argument("--chunk-size", type=int, default=256, help="profiles scored together")
+    parser.add_argument("--instances", type=int, default=1000, help="simulated instances per profile")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable results")
+    parser.add_argument("--out", help="JSON lines results file (stdout if not given)")
+    args = parser.parse_args()
+
+    try:
+        if args.columnar is not None:
+            conn = columnar_open(args.columnar)
+        elif args.mysql:
+            conn = mysql_connect(os.environ.get("CSDATA_MYSQL_PASSWORD", ""))
+        else:
+            conn = sqlite_connect(args.db, read_only=True)
+
+    except DatabaseError as e:
+        sys.exit(str(e) + "\nNo database connection.")
+
+    batch_schools_consider, unknown_schools = batch_schools(batch_read(args.schools), school_directory_load(conn))
+
+    for unknown_school in unknown_schools:
+        print("No data for school:", unknown_school, file=sys.stderr)
+
+    optimize_params = batch_params(args.params, **{'Chance Threshold': args.chance_threshold,
+                                                   'Num Apps': args.num_apps,
+                                                   'Chance Mod': args.chance_mod,
+                                                   'Threshold Mod': args.threshold_mod})
+
+    out = sys.stdout if args.out is None else open(args.out, 'w', encoding='UTF-8')
+
+    try:
+        for batch_result in batch_score(conn, batch_read(args.profiles), batch_schools_consider, optimize_params,
+                                        args.chunk_size, args.instances, args.seed, args.method):
+            out.write(json.dumps(batch_result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        conn.close()
@@ -1,13 +1,20 @@
 """Queries, calculates, and prints computer science grad school acceptance
 chances.
 
-Calculation is based on user-data scraped from grad-cafe.com into MySQL
-database.
+Calculation is based on user-data scraped from grad-cafe.com into a MySQL
+or SQLite database.
 """
 
+import functools
+import hashlib
 import random
-import scipy.stats as stats
-import pymysql
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from chance_cache import chance_cache_get, chance_cache_key, chance_cache_put, chance_dataset_version
+from columnar import ColumnarCursor, ColumnarStore
+from distributions import PERCENTILE_Z, binom_isf, binom_ppf, normal_cdf, normal_cdf_array, normal_ppf
+from profiling import profile_count, profile_execute, profile_fetchall, profile_span
 from statistics import stdev
 
 __author__ = "Jacob Lydon"
@@ -20,9 +27,24 @@ __maintainer__ = "Jacob Lydon"
 __email__ = "jlydon001@regis.edu"
 __status__ = "Development"
 
+# Aggregates and profile-independent statistics of one school and degree, as stored in school_stats.
+SchoolModel = namedtuple("SchoolModel", ["School", "Degree", "Applicants", "Accepted", "Rejected", "GPA", "GPADev",
+                                         "Verbal", "VerbalDev", "Quant", "QuantDev", "Combined", "CombinedDev", "AW",
+                                         "AWDev", "AcceptRate", "Applied", "AcceptHigh", "AcceptLow", "SampleZ",
+                                         "BelowStdDev", "AboveStdDev"])
+
+# SchoolModel fields holding chance_school_stats results, with their school data keys.
+SCHOOL_MODEL_STATS = {"AcceptRate": "Accept Rate",
+                      "Applied": "Applied",
+                      "AcceptHigh": "Accept High",
+                      "AcceptLow": "Accept Low",
+                      "SampleZ": "Sample Z",
+                      "BelowStdDev": "Below Std Dev",
+                      "AboveStdDev": "Above Std Dev"}
+
 
 def chance_query(db_connection, schools):
-    """Queries csdata database for chosen schools.
+    """Queries the school_stats summary of csdata for chosen schools.
 
     Fetches the following data for each school and degree type, where
     at least 1 applicant was accepted or rejected in database:
@@ -35,61 +57,90 @@ def chance_query(db_connection, schools):
         - GRE Verbal (avg. and std. dev.)
         - GRE Combined (avg. and std. dev.)
         - GRE A/W (avg. and std. dev.)
+        - Precomputed SchoolModel statistics (steps 1, 2, 4, 5 and 6)
 
-    :param db_connection: Database connection to csdata.
-    :param schools: List of potential schools.
+    Rows are looked up by their (School, Degree) key, so school_stats must be
+    refreshed (see school_stats.py) after new data is loaded into csdata. A
+    ColumnarStore (see columnar.py) is aggregated directly instead.
+
+    Rows are tuples in SchoolModel field order, to be read in bulk with
+    fetchall and SchoolModel._make. The number of (School, Degree) keys is
+    padded to a power of 2, so a few statement texts cover any school list
+    and stay in the connection's prepared statement cache.
+
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
+    :param schools: List of potential schools, or None for the PhD and MS of
+                    every school.
     :return: Cursor for queried data.
     """
-    cursor = db_connection.cursor(pymysql.cursors.DictCursor)
-    phd_query = ""
-    ms_query = ""
+    program_keys = []
 
-    for school in schools:
+    for school in schools or ():
         if school['PhD'] == 'Yes':
-            phd_query += "School LIKE '" + school['Name'] + "' OR "
+            program_keys += [school['Name'], "PhD"]
         if school['MS'] == 'Yes':
-            ms_query += "School LIKE '" + school['Name'] + "' OR "
+            program_keys += [school['Name'], "MS"]
 
-    if phd_query == "":
-        phd_query = "School LIKE 'No school was selected' OR "
-    if ms_query == "":
-        ms_query = "School LIKE 'No school was selected' OR "
+    if isinstance(db_connection, ColumnarStore):
+        if schools is None:
+            programs = [program for program in db_connection.programs if program[1] in ("PhD", "MS")]
+        else:
+            programs = zip(program_keys[::2], program_keys[1::2])
+
+        return ColumnarCursor([chance_school_model(school_data) for school_data in db_connection.school_stats(programs)
+                               if school_data['Accepted'] + school_data['Rejected'] > 0])
+
+    if schools is None:
+        program_filter = "Degree IN ('PhD', 'MS')"
+    else:
+        if not program_keys:
+            program_keys = ["No school was selected", "PhD"]
 
-    phd_query = phd_query[:-3]
-    ms_query = ms_query[:-3]
+        # Repeated keys match the same rows.
+        num_keys = 1 << (len(program_keys) // 2 - 1).bit_length()
+        program_keys += program_keys[-2:] * (num_keys - len(program_keys) // 2)
+        program_filter = " OR ".join(["(School = %s AND Degree = %s)"] * (len(program_keys) // 2))
 
+    cursor = db_connection.cursor()
     select_query = """
-        SELECT * FROM (SELECT
+        SELECT
             School,
-            COUNT(ID) AS Applicants,
             Degree,
-            COALESCE(SUM(Status LIKE "Accepted"), 0) AS Accepted,
-            COALESCE(SUM(Status LIKE "Rejected"), 0) AS Rejected,
-            (AVG(GPA) + 0E0) AS GPA,
-            STDDEV_SAMP(GPA) As GPADev,
-            (AVG(GREV) + 0E0) AS Verbal,
-            STDDEV_SAMP(GREV) AS VerbalDev,
-            (AVG(GREQ) + 0E0) AS Quant,
-            STDDEV_SAMP(GREQ) AS QuantDev,
-            (AVG(GRET) + 0E0) AS Combined,
-            STDDEV_SAMP(GRET) CombinedDev,
-            (AVG(GREAW) + 0E0) AS AW,
-            STDDEV_SAMP(GREAW) AS AWDev
-        FROM csdata
-        WHERE (Degree = "PhD" AND (""" + phd_query + """)) OR (Degree = "MS" AND (""" + ms_query + """))
-        GROUP BY School, Degree) AS Inner_Table
-        WHERE (Accepted + Rejected) > 0
+            Applicants,
+            Accepted,
+            Rejected,
+            GPA,
+            GPADev,
+            Verbal,
+            VerbalDev,
+            Quant,
+            QuantDev,
+            Combined,
+            CombinedDev,
+            AW,
+            AWDev,
+            AcceptRate,
+            Applied,
+            AcceptHigh,
+            AcceptLow,
+            SampleZ,
+            BelowStdDev,
+            AboveStdDev
+        FROM school_stats
+        WHERE (Accepted + Rejected) > 0 AND (""" + program_filter + """)
+        ORDER BY School, Degree
         """
 
-    cursor.execute(select_query)
+    profile_execute("chance_query", cursor, select_query, program_keys)
     return cursor
 
 
-def chance_calc(db_connection, user_data, schools):
+def chance_calc(db_connection, user_data, schools, method="vectorized", cache=None, seed=None, workers=None):
     """Calculates an acceptance chance for each potential school and degree.
 
     Student profile data and school data are analyzed to produce an estimated
-    chance of acceptance.
+    chance of acceptance. Steps 1, 2, 4, 5 and 6 do not depend on the profile
+    and are read from the SchoolModel statistics stored in school_stats.
 
     Algorithm:
     1.  Calc sample acceptance rate.
@@ -120,7 +171,21 @@ def chance_calc(db_connection, user_data, schools):
     7.  Monte Carlo simulation to account for unknowns. 1000 student profile
         instances are given a weighted average z-score, which is compared with
         step 5 and 6 calcs to give an instance chance. Chance is the average
-        of the instance chances.
+        of the instance chances. The "vectorized" method draws all instances
+        as NumPy arrays; the "loop" method simulates one instance at a time.
+        The "quadrature" method replaces the simulation with a deterministic
+        quadrature of the same expectation (see chance_quadrature) and stores
+        its error estimate, which is not a bound, as 'Chance Error'. It is
+        slower than "vectorized", so it is never the default. The "adaptive"
+        and "sobol" methods simulate until the chance's standard error is
+        small enough (see chance_simulate_adaptive), storing it as 'Chance
+        Error' and the number of instances as 'Chance Samples'.
+
+        Each school and degree draws from its own generator, seeded by seed
+        and a hash of the school and degree (see chance_program_seed), so a
+        program's chance does not depend on the other schools queried. With
+        workers, steps 3 and 7 run in a process pool, with the same results
+        for any number of workers.
 
         LOR, SOP, and Research are random variables between their respective
         inputted ranges converted to z-scores. Category weights are random
@@ -136,118 +201,684 @@ def chance_calc(db_connection, user_data, schools):
             - Combined 1 to 5
             - AW 1 to 5
 
-    :param db_connection: Database connection to csdata.
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
     :param user_data: Ordered Dictionary containing student profile data.
     :param schools: List of potential schools.
+    :param method: Step 7 simulation method, "vectorized", "loop", "quadrature",
+                   "adaptive", or "sobol".
+    :param cache: Optional dict containing a chance cache (see chance_cache.py).
+                  Cached schools and degrees are neither queried nor simulated.
+    :param seed: Optional int seed for the numpy simulation methods.
+    :param workers: Optional int number of worker processes. Schools are
+                    calculated serially in this process if not given.
     :return: List of potential schools, with data and calculated chance.
     """
-    cursor = chance_query(db_connection, schools)
-    item = cursor.fetchone()
-
-    while item is not None:
-        school_data = item
-
-        # Algorithm Step 1.
-        school_data['Accept Rate'] = float(school_data["Accepted"]) / (float(school_data['Accepted'])
-                                                                       + float(school_data["Rejected"]))
-        school_data['Applied'] = float(school_data['Accepted'] + school_data['Rejected'])
-
-        # Algorithm Step 2.
-        if school_data['Accept Rate'] == 1:
-            test_accept_rate = .99
-        elif school_data['Accept Rate'] == 0:
-            test_accept_rate = 0.01
-        else:
-            test_accept_rate = school_data['Accept Rate']
-
-        # Algorithm Step 3.
-        try:
-            z_gpa = (user_data['GPA'] - school_data["GPA"]) / school_data['GPADev']
-        except (ValueError, ZeroDivisionError):
-            z_gpa = 0.1
-        try:
-            z_other_gpa = (user_data['Other GPA'] - school_data["GPA"]) / school_data['GPADev']
-        except (ValueError, ZeroDivisionError):
-            z_other_gpa = 0.1
-        try:
-            z_verbal = (user_data['Verbal'] - school_data["Verbal"]) / school_data["VerbalDev"]
-        except (ValueError, ZeroDivisionError):
-            z_verbal = 2.0
-        try:
-            z_quant = (user_data['Quant'] - school_data["Quant"]) / school_data["QuantDev"] / school_data["QuantDev"]
-        except (ValueError, ZeroDivisionError):
-            z_quant = 2.0
-        try:
-            z_combined = ((user_data['Quant'] + user_data['Verbal']) - school_data["Combined"]) \
-                         / school_data["CombinedDev"]
-        except (ValueError, ZeroDivisionError):
-            z_combined = 5.0
-        try:
-            z_aw = (user_data['AW'] - school_data["AW"]) / school_data["AWDev"] / school_data['AWDev']
-        except (ValueError, ZeroDivisionError):
-            z_aw = 0.5
-
-        # Algorithm Step 4.
-        school_data['Accept High'] = stats.binom.ppf(.99, school_data['Applied'], test_accept_rate)
-        school_data['Accept Low'] = stats.binom.isf(.99, school_data['Applied'], test_accept_rate)
-
-        # Algorithm Step 5.
-        if school_data['Accept High'] == school_data['Applied']:
-            high = stats.norm.ppf(0.001)
-        else:
-            high = stats.norm.ppf(1 - (school_data['Accept High'] / school_data['Applied']))
-        if school_data['Accept Low'] == 0:
-            low = stats.norm.ppf(.999)
-        else:
-            low = stats.norm.ppf(1 - (school_data['Accept Low'] / school_data['Applied']))
-        sample = stats.norm.ppf(1 - test_accept_rate)
-
-        # Algorithm Step 6.
-        below_avg_stdev = stdev([high, sample, low])
-        above_avg_stdev = (3 - sample) / 3
-
-        # Algorithm Step 7.
-        instances = 1000
-        chance_sum = 0
-        for i in range(0, 1000):
-            z_lor = stats.norm.ppf((random.randint(user_data["LOR Low"], user_data["LOR High"])) / 100)
-            z_sop = stats.norm.ppf((random.randint(user_data["SOP Low"], user_data["SOP High"])) / 100)
-            z_research = stats.norm.ppf((random.randint(user_data["Research Low"],
-                                                        user_data["Research High"])) / 100)
-
-            weights = {"LOR": random.randint(15, 30),
-                       "SOP": random.randint(15, 30),
-                       "Research": random.randint(15, 30),
-                       "GPA": 7.5,
-                       "Quant": random.randint(10, 15),
-                       "Verbal": random.randint(1, 5),
-                       "Combined": random.randint(1, 5),
-                       "AW": random.randint(1, 5)}
-
-            sum_instance = z_lor * weights["LOR"] + z_sop * weights["SOP"] + z_research * weights["Research"] \
-                           + z_gpa * weights["GPA"] + z_other_gpa * weights["GPA"] + z_quant * weights["Quant"] \
-                           + z_verbal * weights["Verbal"] + z_combined * weights["Combined"] + z_aw * weights["AW"]
-
-            z_score_instance = sum_instance / sum(weights.values())
-
-            if z_score_instance > sample:
-                chance_sum += stats.norm.cdf(z_score_instance, sample, above_avg_stdev)
-            else:
-                chance_sum += stats.norm.cdf(z_score_instance, sample, below_avg_stdev)
-
-            school_data['Chance'] = chance_sum / instances * 100
+    if method not in ("loop", "vectorized", "quadrature", "adaptive", "sobol"):
+        raise ValueError("Unknown chance method: " + str(method))
+
+    school_rows = []
+    query_schools = schools
+    cache_keys = dict()
+
+    if cache is not None:
+        settings = {"Method": method, "Instances": 1000, "Seed": seed}
+        dataset_version = chance_dataset_version(db_connection)
+        query_schools = []
+
+        for school in schools:
+            query_school = {'Name': school['Name'], 'PhD': 'No', 'MS': 'No'}
+
+            for degree in ("PhD", "MS"):
+                if school[degree] == 'Yes':
+                    cache_key = chance_cache_key(user_data, school['Name'], degree, settings, dataset_version)
+                    cached_data = chance_cache_get(cache, cache_key)
+
+                    if cached_data is None:
+                        query_school[degree] = 'Yes'
+                        cache_keys[(school['Name'], degree)] = cache_key
+                    elif cached_data:
+                        school_rows.append(cached_data)
 
+            if 'Yes' in (query_school['PhD'], query_school['MS']):
+                query_schools.append(query_school)
+
+    if query_schools or cache is None:
+        cursor = chance_query(db_connection, query_schools)
+    else:
+        cursor = None
+
+    items = [] if cursor is None else profile_fetchall("chance_query", cursor)
+    seeds = [chance_program_seed(seed, item[0], item[1]) for item in items]
+
+    if workers is None:
+        calculated_rows = [_chance_program(user_data, item, method, item_seed) for item, item_seed in zip(items, seeds)]
+    else:
+        chunk_size = max(1, len(items) // (workers * 4))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            calculated_rows = list(executor.map(_chance_program, [user_data] * len(items), items,
+                                                [method] * len(items), seeds, chunksize=chunk_size))
+
+    for school_data in calculated_rows:
+        if (school_data["School"], school_data["Degree"]) in cache_keys:
+            chance_cache_put(cache, cache_keys.pop((school_data["School"], school_data["Degree"])), school_data)
+
+        school_rows.append(school_data)
+
+    # Schools and degrees without enough data are cached as empty.
+    for cache_key in cache_keys.values():
+        chance_cache_put(cache, cache_key, dict())
+
+    if cache is not None:
+        school_rows.sort(key=lambda school_data: (school_data["School"], school_data["Degree"]))
+
+    for school_data in school_rows:
         for school in schools:
             if school['Name'] == school_data["School"] and school[school_data["Degree"]] == "Yes":
                 school[str(school_data["Degree"]) + " Chance"] = school_data['Chance'] / 100
 
         chance_print(school_data)
 
-        item = cursor.fetchone()
+    return schools
 
-    db_connection.close()
 
-    return schools
+def chance_program_seed(seed, school_name, degree):
+    """Derives the random seed of one school and degree from a seed.
+
+    :param seed: Optional int seed. Without one, a fresh seed is drawn.
+    :param school_name: String school name.
+    :param degree: String degree, "PhD" or "MS".
+    :return: numpy SeedSequence.
+    """
+    if seed is None:
+        return np.random.SeedSequence()
+
+    program_hash = hashlib.sha256((school_name + "\0" + degree).encode('UTF-8')).digest()
+
+    return np.random.SeedSequence([seed, int.from_bytes(program_hash[:8], "little")])
+
+
+def _chance_program(user_data, item, method, rng):
+    """Calculates the chance of one queried school and degree (steps 3 and 7
+    of chance_calc).
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param item: Tuple containing a queried school_stats row.
+    :param method: Step 7 simulation method (see chance_calc).
+    :param rng: numpy Generator, or a SeedSequence for a new one.
+    :return: Dict containing school data and calculated chance.
+    """
+    rng = np.random.default_rng(rng)
+
+    # Algorithm Steps 1, 2, 4, 5 and 6, precomputed in school_stats.
+    with profile_span("chance.steps_1_2_4_5_6"):
+        school_data = chance_school_model_data(SchoolModel._make(item))
+
+    # Algorithm Step 3.
+    with profile_span("chance.step_3"):
+        z_scores = chance_z_scores(user_data, school_data)
+
+    # Algorithm Step 7.
+    with profile_span("chance.step_7." + method):
+        if method == "loop":
+            school_data['Chance'] = chance_simulate(user_data, z_scores, school_data)
+            profile_count("chance.instances", 1000)
+        elif method == "quadrature":
+            school_data['Chance'], school_data['Chance Error'] = chance_quadrature(user_data, z_scores, school_data)
+        elif method in ("adaptive", "sobol"):
+            school_data['Chance'], school_data['Chance Error'], school_data['Chance Samples'] = \
+                chance_simulate_adaptive(user_data, z_scores, school_data, rng=rng, sobol=method == "sobol")
+            profile_count("chance.instances", school_data['Chance Samples'])
+        else:
+            school_data['Chance'] = chance_simulate_vectorized(user_data, z_scores, school_data, rng=rng)
+            profile_count("chance.instances", 1000)
+
+    profile_count("chance.simulations")
+
+    return school_data
+
+
+def chance_school_stats(school_data):
+    """Calculates the profile-independent acceptance statistics of a school.
+
+    Covers steps 1, 2, 4, 5 and 6 of the chance_calc algorithm. Results are
+    stored in school_data under 'Accept Rate', 'Applied', 'Accept High',
+    'Accept Low', 'Sample Z', 'Below Std Dev' and 'Above Std Dev'.
+
+    :param school_data: Dict containing queried school data.
+    :return: Dict containing school data and acceptance statistics.
+    """
+    # Algorithm Step 1.
+    school_data['Accept Rate'] = float(school_data["Accepted"]) / (float(school_data['Accepted'])
+                                                                   + float(school_data["Rejected"]))
+    school_data['Applied'] = float(school_data['Accepted'] + school_data['Rejected'])
+
+    # Algorithm Step 2.
+    if school_data['Accept Rate'] == 1:
+        test_accept_rate = .99
+    elif school_data['Accept Rate'] == 0:
+        test_accept_rate = 0.01
+    else:
+        test_accept_rate = school_data['Accept Rate']
+
+    # Algorithm Step 4.
+    school_data['Accept High'] = binom_ppf(.99, school_data['Applied'], test_accept_rate)
+    school_data['Accept Low'] = binom_isf(.99, school_data['Applied'], test_accept_rate)
+
+    # Algorithm Step 5.
+    # Ranges of only 0 or only Applied accepted (i.e. a single applicant) are clamped like the rate in step 2.
+    if school_data['Accept High'] == school_data['Applied']:
+        high = normal_ppf(0.001)
+    elif school_data['Accept High'] == 0:
+        high = normal_ppf(.999)
+    else:
+        high = normal_ppf(1 - (school_data['Accept High'] / school_data['Applied']))
+    if school_data['Accept Low'] == 0:
+        low = normal_ppf(.999)
+    elif school_data['Accept Low'] == school_data['Applied']:
+        low = normal_ppf(0.001)
+    else:
+        low = normal_ppf(1 - (school_data['Accept Low'] / school_data['Applied']))
+    school_data['Sample Z'] = normal_ppf(1 - test_accept_rate)
+
+    # Algorithm Step 6.
+    school_data['Below Std Dev'] = stdev([high, school_data['Sample Z'], low])
+    school_data['Above Std Dev'] = (3 - school_data['Sample Z']) / 3
+
+    return school_data
+
+
+def chance_school_model(school_data):
+    """Builds the SchoolModel of a school from its queried aggregates.
+
+    Runs chance_school_stats on a copy of school_data, so the binomial and
+    normal quantiles are computed once per school and degree.
+
+    :param school_data: Dict containing queried school data.
+    :return: SchoolModel of the school and degree.
+    """
+    with profile_span("chance.school_model"):
+        school_data = chance_school_stats(dict(school_data))
+
+    return SchoolModel(*[float(school_data[SCHOOL_MODEL_STATS[field]]) if field in SCHOOL_MODEL_STATS
+                         else school_data[field] for field in SchoolModel._fields])
+
+
+def chance_school_model_data(school_model):
+    """Converts a SchoolModel into a school data dict for scoring.
+
+    :param school_model: SchoolModel of a school and degree.
+    :return: Dict containing school data and acceptance statistics.
+    """
+    return {SCHOOL_MODEL_STATS.get(field, field): value for field, value in school_model._asdict().items()}
+
+
+def chance_z_scores(user_data, school_data):
+    """Calculates z-scores for all known user-data (step 3 of chance_calc).
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param school_data: Dict containing queried school data.
+    :return: Dict of z-scores keyed by profile category.
+    """
+    try:
+        z_gpa = (user_data['GPA'] - school_data["GPA"]) / school_data['GPADev']
+    except (ValueError, ZeroDivisionError):
+        z_gpa = 0.1
+    try:
+        z_other_gpa = (user_data['Other GPA'] - school_data["GPA"]) / school_data['GPADev']
+    except (ValueError, ZeroDivisionError):
+        z_other_gpa = 0.1
+    try:
+        z_verbal = (user_data['Verbal'] - school_data["Verbal"]) / school_data["VerbalDev"]
+    except (ValueError, ZeroDivisionError):
+        z_verbal = 2.0
+    try:
+        z_quant = (user_data['Quant'] - school_data["Quant"]) / school_data["QuantDev"] / school_data["QuantDev"]
+    except (ValueError, ZeroDivisionError):
+        z_quant = 2.0
+    try:
+        z_combined = ((user_data['Quant'] + user_data['Verbal']) - school_data["Combined"]) \
+                     / school_data["CombinedDev"]
+    except (ValueError, ZeroDivisionError):
+        z_combined = 5.0
+    try:
+        z_aw = (user_data['AW'] - school_data["AW"]) / school_data["AWDev"] / school_data['AWDev']
+    except (ValueError, ZeroDivisionError):
+        z_aw = 0.5
+
+    return {"GPA": z_gpa,
+            "Other GPA": z_other_gpa,
+            "Quant": z_quant,
+            "Verbal": z_verbal,
+            "Combined": z_combined,
+            "AW": z_aw}
+
+
+def chance_simulate(user_data, z_scores, school_data, instances=1000):
+    """Monte Carlo simulation of unknown profile data (step 7 of chance_calc).
+
+    Reference implementation, one student profile instance at a time.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param z_scores: Dict of z-scores from chance_z_scores.
+    :param school_data: Dict containing school data and acceptance statistics.
+    :param instances: Int number of simulated student profile instances.
+    :return: Float chance of acceptance as a percent.
+    """
+    sample = school_data['Sample Z']
+    chance_sum = 0
+
+    for i in range(0, instances):
+        z_lor = PERCENTILE_Z[random.randint(user_data["LOR Low"], user_data["LOR High"])]
+        z_sop = PERCENTILE_Z[random.randint(user_data["SOP Low"], user_data["SOP High"])]
+        z_research = PERCENTILE_Z[random.randint(user_data["Research Low"], user_data["Research High"])]
+
+        weights = {"LOR": random.randint(15, 30),
+                   "SOP": random.randint(15, 30),
+                   "Research": random.randint(15, 30),
+                   "GPA": 7.5,
+                   "Quant": random.randint(10, 15),
+                   "Verbal": random.randint(1, 5),
+                   "Combined": random.randint(1, 5),
+                   "AW": random.randint(1, 5)}
+
+        sum_instance = z_lor * weights["LOR"] + z_sop * weights["SOP"] + z_research * weights["Research"] \
+                       + z_scores["GPA"] * weights["GPA"] + z_scores["Other GPA"] * weights["GPA"] \
+                       + z_scores["Quant"] * weights["Quant"] + z_scores["Verbal"] * weights["Verbal"] \
+                       + z_scores["Combined"] * weights["Combined"] + z_scores["AW"] * weights["AW"]
+
+        z_score_instance = sum_instance / sum(weights.values())
+
+        if z_score_instance > sample:
+            chance_sum += normal_cdf(z_score_instance, sample, school_data['Above Std Dev'])
+        else:
+            chance_sum += normal_cdf(z_score_instance, sample, school_data['Below Std Dev'])
+
+    return chance_sum / instances * 100
+
+
+def chance_simulate_vectorized(user_data, z_scores, school_data, instances=1000, rng=None):
+    """Vectorized Monte Carlo simulation (step 7 of chance_calc).
+
+    Draws every instance's LOR, SOP, and Research percentiles and category
+    weights as arrays, then applies the split-tailed CDF of step 6 with a
+    single masked normal_cdf_array call. Statistically equivalent to chance_simulate.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param z_scores: Dict of z-scores from chance_z_scores.
+    :param school_data: Dict containing school data and acceptance statistics.
+    :param instances: Int number of simulated student profile instances.
+    :param rng: Optional numpy Generator used for the random draws.
+    :return: Float chance of acceptance as a percent.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    return float(_instance_chances(user_data, z_scores, school_data, rng.random((instances, 10))).mean() * 100)
+
+
+def chance_simulate_adaptive(user_data, z_scores, school_data, tolerance=0.25, batch_size=64,
+                             max_instances=65536, rng=None, sobol=False):
+    """Adaptive Monte Carlo simulation (step 7 of chance_calc).
+
+    Draws instances in batches until the standard error of the chance is no
+    more than the tolerance, so chances near 0% or 100% stop after a few
+    batches while uncertain ones keep sampling. With sobol, the instances
+    come from 16 independently scrambled Sobol sequences instead, and the
+    standard error is taken across the 16 sequence means.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param z_scores: Dict of z-scores from chance_z_scores.
+    :param school_data: Dict containing school data and acceptance statistics.
+    :param tolerance: Float target standard error in percentage points.
+    :param batch_size: Int number of instances per batch. With sobol, split
+                       across the sequences and rounded up to powers of 2.
+    :param max_instances: Int max number of simulated instances.
+    :param rng: Optional numpy Generator used for the random draws and scrambles.
+    :param sobol: Bool to use scrambled Sobol points instead of random draws.
+    :return: Tuple of float chance of acceptance as a percent, float standard
+             error in percentage points, and int number of instances.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if sobol:
+        from scipy.stats import qmc
+
+        sequences = [qmc.Sobol(10, scramble=True, seed=sequence_rng) for sequence_rng in rng.spawn(16)]
+        # Whole powers of 2 keep each batch a balanced part of its Sobol sequence.
+        batch_size = 1 << max(0, int(batch_size // len(sequences) - 1).bit_length())
+        sequence_sums = np.zeros(len(sequences))
+        instances = 0
+
+        while True:
+            for position, sequence in enumerate(sequences):
+                sequence_sums[position] += _instance_chances(user_data, z_scores, school_data,
+                                                             sequence.random(batch_size)).sum()
+            instances += batch_size * len(sequences)
+
+            sequence_means = sequence_sums / (instances / len(sequences))
+            standard_error = sequence_means.std(ddof=1) / np.sqrt(len(sequences)) * 100
+
+            if standard_error <= tolerance or instances >= max_instances:
+                return float(sequence_means.mean() * 100), float(standard_error), instances
+
+    chance_sum = 0.0
+    chance_square_sum = 0.0
+    instances = 0
+
+    while True:
+        instance_chances = _instance_chances(user_data, z_scores, school_data, rng.random((batch_size, 10)))
+        chance_sum += instance_chances.sum()
+        chance_square_sum += (instance_chances ** 2).sum()
+        instances += batch_size
+
+        mean = chance_sum / instances
+        variance = max(chance_square_sum / instances - mean ** 2, 0.0) * instances / (instances - 1)
+        standard_error = np.sqrt(variance / instances) * 100
+
+        if standard_error <= tolerance or instances >= max_instances:
+            return float(mean * 100), float(standard_error), instances
+
+
+def _instance_chances(user_data, z_scores, school_data, uniforms):
+    """Instance chances of step 7 for uniform draws on [0, 1).
+
+    Columns of uniforms are mapped to the LOR, SOP, and Research percentiles
+    and the LOR, SOP, Research, Quant, Verbal, Combined, and AW weights.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param z_scores: Dict of z-scores from chance_z_scores.
+    :param school_data: Dict containing school data and acceptance statistics.
+    :param uniforms: Instances x 10 array of uniform draws.
+    :return: Array of instance chances (0 to 1).
+    """
+    def uniform_integers(column, low, high):
+        return np.minimum(low + np.floor(uniforms[:, column] * (high - low + 1)), high)
+
+    def percentile_z(column, low_key, high_key):
+        return PERCENTILE_Z[uniform_integers(column, int(user_data[low_key]), int(user_data[high_key])).astype(int)]
+
+    z_lor = percentile_z(0, "LOR Low", "LOR High")
+    z_sop = percentile_z(1, "SOP Low", "SOP High")
+    z_research = percentile_z(2, "Research Low", "Research High")
+
+    w_lor = uniform_integers(3, 15, 30)
+    w_sop = uniform_integers(4, 15, 30)
+    w_research = uniform_integers(5, 15, 30)
+    w_gpa = 7.5
+    w_quant = uniform_integers(6, 10, 15)
+    w_verbal = uniform_integers(7, 1, 5)
+    w_combined = uniform_integers(8, 1, 5)
+    w_aw = uniform_integers(9, 1, 5)
+
+    sum_instance = z_lor * w_lor + z_sop * w_sop + z_research * w_research \
+        + (z_scores["GPA"] + z_scores["Other GPA"]) * w_gpa + z_scores["Quant"] * w_quant \
+        + z_scores["Verbal"] * w_verbal + z_scores["Combined"] * w_combined + z_scores["AW"] * w_aw
+
+    # The GPA weight is shared by GPA and Other GPA but only counted once.
+    z_score_instance = sum_instance / (w_lor + w_sop + w_research + w_gpa + w_quant + w_verbal + w_combined + w_aw)
+
+    sample = school_data['Sample Z']
+    instance_stdev = np.where(z_score_instance > sample, school_data['Above Std Dev'], school_data['Below Std Dev'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return normal_cdf_array((z_score_instance - sample) / instance_stdev)
+
+
+def chance_quadrature(user_data, z_scores, school_data, percentile_nodes=4, weight_nodes=2):
+    """Deterministic quadrature of the step 7 expectation of chance_calc.
+
+    Step 7 averages the instance chance over independent, uniformly drawn
+    LOR, SOP, and Research percentiles and category weights. Each of those
+    discrete distributions is replaced by a Gauss quadrature rule for it
+    (nodes and weights exact for polynomials of degree 2n - 1), and the
+    instance chance is summed over the tensor product of the rules. Ranges
+    with no more values than nodes are enumerated exactly. Percentiles enter
+    as their z-scores, so the rules are built on PERCENTILE_Z. The rules
+    only depend on the ranges, so they are built once and reused.
+
+    The error is estimated as the change from a rule with one less
+    percentile node. It is an estimate, not a bound: it covers the
+    percentile rules only, and the instance chance is not smooth where the
+    instance z-score crosses the sample z-score. For the test profile, the
+    default 4 node rules are within 0.003 percentage points of 16 node
+    rules, and the estimate is about 0.02 percentage points.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param z_scores: Dict of z-scores from chance_z_scores.
+    :param school_data: Dict containing school data and acceptance statistics.
+    :param percentile_nodes: Int number of nodes per percentile range (at least 2).
+    :param weight_nodes: Int number of nodes per category weight range.
+    :return: Tuple of float chance of acceptance as a percent and float error
+             estimate in percentage points.
+    """
+    chance = _chance_quadrature_rule(user_data, z_scores, school_data, percentile_nodes, weight_nodes)
+    coarse_chance = _chance_quadrature_rule(user_data, z_scores, school_data, percentile_nodes - 1, weight_nodes)
+
+    return chance, abs(chance - coarse_chance)
+
+
+def _chance_quadrature_rule(user_data, z_scores, school_data, percentile_nodes, weight_nodes):
+    (z_lor, p_lor), (z_sop, p_sop), (z_research, p_research) = \
+        [_percentile_rule(int(user_data[low_key]), int(user_data[high_key]), percentile_nodes)
+         for low_key, high_key in (("LOR Low", "LOR High"), ("SOP Low", "SOP High"),
+                                   ("Research Low", "Research High"))]
+    (w_lor, w_sop, w_research, w_quant, w_verbal, w_combined, w_aw), p_weights = _weight_rule(weight_nodes)
+    w_gpa = 7.5
+
+    # Axes are LOR, SOP, Research, and the flattened weight rule, so the arithmetic spans the tensor product.
+    z_lor = z_lor[:, None, None, None]
+    z_sop = z_sop[None, :, None, None]
+    z_research = z_research[None, None, :, None]
+
+    sum_instance = z_lor * w_lor + z_sop * w_sop + z_research * w_research \
+        + ((z_scores["GPA"] + z_scores["Other GPA"]) * w_gpa + z_scores["Quant"] * w_quant
+           + z_scores["Verbal"] * w_verbal + z_scores["Combined"] * w_combined + z_scores["AW"] * w_aw)
+    z_score_instance = sum_instance / (w_lor + w_sop + w_research + w_gpa + w_quant + w_verbal + w_combined + w_aw)
+
+    sample = school_data['Sample Z']
+    instance_stdev = np.where(z_score_instance > sample, school_data['Above Std Dev'], school_data['Below Std Dev'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        instance_chance = normal_cdf_array((z_score_instance - sample) / instance_stdev)
+
+    for weights in (p_weights, p_research, p_sop, p_lor):
+        instance_chance = np.tensordot(instance_chance, weights, axes=([-1], [0]))
+
+    return float(instance_chance) * 100
+
+
+@functools.lru_cache(maxsize=None)
+def _percentile_rule(low, high, num_nodes):
+    """Gauss quadrature rule for the z-score of a percentile uniformly drawn
+    between low and high.
+
+    :param low: Int lowest percentile.
+    :param high: Int highest percentile.
+    :param num_nodes: Int number of nodes.
+    :return: Tuple of node and weight arrays.
+    """
+    return _discrete_gauss_rule(PERCENTILE_Z[low:high + 1], num_nodes)
+
+
+@functools.lru_cache(maxsize=None)
+def _weight_rule(num_nodes):
+    """Tensor product of the Gauss quadrature rules for the LOR, SOP,
+    Research, Quant, Verbal, Combined, and AW weights, flattened.
+
+    :param num_nodes: Int number of nodes per weight range.
+    :return: Tuple of a tuple of node arrays, one per weight, and the
+             matching weight array.
+    """
+    rules = [_discrete_gauss_rule(np.arange(low, high + 1, dtype=float), num_nodes)
+             for low, high in ((15, 30), (15, 30), (15, 30), (10, 15), (1, 5), (1, 5), (1, 5))]
+    nodes = np.meshgrid(*[rule_nodes for rule_nodes, _ in rules], indexing='ij')
+    weights = np.meshgrid(*[rule_weights for _, rule_weights in rules], indexing='ij')
+
+    return tuple(weight_nodes.ravel() for weight_nodes in nodes), np.prod(weights, axis=0).ravel()
+
+
+def _discrete_gauss_rule(values, num_nodes):
+    """Gauss quadrature rule for a uniform distribution over given values.
+
+    Built with the Lanczos process on the distribution's Jacobi matrix.
+    Infinite values (the z-scores of percentiles 0 and 100) are kept as exact
+    nodes.
+
+    :param values: Array of equally likely values.
+    :param num_nodes: Int number of nodes for the finite values.
+    :return: Tuple of node and weight arrays.
+    """
+    finite = np.isfinite(values)
+    finite_values = values[finite]
+    mass = 1.0 / len(values)
+
+    if len(finite_values) <= num_nodes:
+        return values, np.full(len(values), mass)
+
+    vector = np.full(len(finite_values), 1 / np.sqrt(len(finite_values)))
+    previous_vector = np.zeros(len(finite_values))
+    diagonal = []
+    off_diagonal = []
+    norm = 0.0
+
+    for step in range(num_nodes):
+        next_vector = finite_values * vector
+        diagonal.append(vector @ next_vector)
+        next_vector -= diagonal[-1] * vector + norm * previous_vector
+        norm = np.sqrt(next_vector @ next_vector)
+
+        if step < num_nodes - 1:
+            off_diagonal.append(norm)
+            previous_vector = vector
+            vector = next_vector / norm
+
+    nodes, eigenvectors = np.linalg.eigh(np.diag(diagonal) + np.diag(off_diagonal, 1) + np.diag(off_diagonal, -1))
+    weights = eigenvectors[0] ** 2 * mass * len(finite_values)
+
+    return np.concatenate([nodes, values[~finite]]), np.concatenate([weights, np.full((~finite).sum(), mass)])
+
+
+def chance_matrix(db_connection, profiles, schools, instances=1000, rng=None, school_rows=None):
+    """Calculates acceptance chances for many student profiles at once.
+
+    Queries the schools and their precomputed profile-independent statistics
+    (steps 1, 2, 4, 5 and 6) a single time, then scores every profile
+    against every school and degree by broadcasting steps 3 and 7 over
+    profile x school x instance arrays. Profiles are processed in chunks to
+    bound memory use. Unlike chance_calc, nothing is printed.
+
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
+    :param profiles: List of Ordered Dictionaries containing student profile data.
+    :param schools: List of potential schools.
+    :param instances: Int number of simulated student profile instances.
+    :param rng: Optional numpy Generator used for the random draws.
+    :param school_rows: Optional list of school data dicts, i.e. the 'School
+                        Data' of an earlier call, used in place of querying
+                        schools.
+    :return: Dict with 'Programs', a list of (School, Degree) tuples,
+             'School Data', the matching list of school data dicts, and
+             'Chances', a profiles x programs array of chances (0 to 1).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if school_rows is None:
+        cursor = chance_query(db_connection, schools)
+        school_rows = [chance_school_model_data(SchoolModel._make(item))
+                       for item in profile_fetchall("chance_query", cursor)]
+    programs = [(school_data['School'], school_data['Degree']) for school_data in school_rows]
+    chances = np.zeros((len(profiles), len(school_rows)))
+
+    if not profiles or not school_rows:
+        return {"Programs": programs, "School Data": school_rows, "Chances": chances}
+
+    def profile_column(key):
+        return np.array([profile[key] for profile in profiles], dtype=float)
+
+    def school_column(key):
+        return np.array([school_data[key] for school_data in school_rows], dtype=float)
+
+    # Algorithm Step 3, as profiles x schools arrays.
+    with profile_span("chance.matrix.step_3"):
+        gpa_mean = school_column("GPA")
+        gpa_dev = school_column("GPADev")
+        z_gpa = _z_score_matrix(profile_column('GPA'), gpa_mean, gpa_dev, 0.1)
+        z_other_gpa = _z_score_matrix(profile_column('Other GPA'), gpa_mean, gpa_dev, 0.1)
+        z_verbal = _z_score_matrix(profile_column('Verbal'), school_column("Verbal"), school_column("VerbalDev"), 2.0)
+        z_quant = _z_score_matrix(profile_column('Quant'), school_column("Quant"), school_column("QuantDev"), 2.0,
+                                  dev_power=2)
+        z_combined = _z_score_matrix(profile_column('Quant') + profile_column('Verbal'), school_column("Combined"),
+                                     school_column("CombinedDev"), 5.0)
+        z_aw = _z_score_matrix(profile_column('AW'), school_column("AW"), school_column("AWDev"), 0.5, dev_power=2)
+
+    sample = school_column('Sample Z')[None, :, None]
+    below_avg_stdev = school_column('Below Std Dev')[None, :, None]
+    above_avg_stdev = school_column('Above Std Dev')[None, :, None]
+
+    # Algorithm Step 7, keeping each chunk near 4 million simulated instances.
+    chunk = max(1, 4000000 // (len(school_rows) * instances))
+    profile_count("chance.simulations", len(profiles) * len(school_rows))
+    profile_count("chance.instances", len(profiles) * len(school_rows) * instances)
+
+    with profile_span("chance.matrix.step_7"):
+        for start in range(0, len(profiles), chunk):
+            stop = min(start + chunk, len(profiles))
+            size = (stop - start, instances)
+            chunk_profiles = profiles[start:stop]
+
+            def percentile_z(low_key, high_key):
+                low = np.array([int(profile[low_key]) for profile in chunk_profiles])[:, None]
+                high = np.array([int(profile[high_key]) for profile in chunk_profiles])[:, None]
+                return PERCENTILE_Z[rng.integers(low, high, size=size, endpoint=True)]
+
+            w_lor = rng.integers(15, 30, size=size, endpoint=True)
+            w_sop = rng.integers(15, 30, size=size, endpoint=True)
+            w_research = rng.integers(15, 30, size=size, endpoint=True)
+            w_gpa = 7.5
+            w_quant = rng.integers(10, 15, size=size, endpoint=True)
+            w_verbal = rng.integers(1, 5, size=size, endpoint=True)
+            w_combined = rng.integers(1, 5, size=size, endpoint=True)
+            w_aw = rng.integers(1, 5, size=size, endpoint=True)
+
+            unknown_sum = percentile_z("LOR Low", "LOR High") * w_lor + percentile_z("SOP Low", "SOP High") * w_sop \
+                + percentile_z("Research Low", "Research High") * w_research
+            weight_sum = w_lor + w_sop + w_research + w_gpa + w_quant + w_verbal + w_combined + w_aw
+
+            sum_instance = unknown_sum[:, None, :] \
+                + ((z_gpa[start:stop] + z_other_gpa[start:stop]) * w_gpa)[:, :, None] \
+                + z_quant[start:stop, :, None] * w_quant[:, None, :] \
+                + z_verbal[start:stop, :, None] * w_verbal[:, None, :] \
+                + z_combined[start:stop, :, None] * w_combined[:, None, :] \
+                + z_aw[start:stop, :, None] * w_aw[:, None, :]
+            z_score_instance = sum_instance / weight_sum[:, None, :]
+
+            instance_stdev = np.where(z_score_instance > sample, above_avg_stdev, below_avg_stdev)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                chances[start:stop] = normal_cdf_array((z_score_instance - sample) / instance_stdev).mean(axis=2)
+
+    return {"Programs": programs, "School Data": school_rows, "Chances": chances}
+
+
+def _z_score_matrix(user_values, school_means, school_devs, default, dev_power=1):
+    """Broadcasts a step 3 z-score over profiles x schools.
+
+    Schools with a zero std. dev. get the same default z-score chance_z_scores
+    falls back to.
+
+    :param user_values: Array of profile values.
+    :param school_means: Array of school averages.
+    :param school_devs: Array of school std. devs.
+    :param default: Float z-score used when the std. dev. is zero.
+    :param dev_power: Int number of times the value is divided by the std. dev.
+    :return: Profiles x schools array of z-scores.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (user_values[:, None] - school_means[None, :]) / school_devs[None, :] ** dev_power
+
+    return np.where(school_devs[None, :] == 0, default, z_scores)
 
 
 def chance_print(school_data):
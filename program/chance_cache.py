@@ -0,0 +1,220 @@
+"""Persistent cache of calculated acceptance chances.
+
+Entries are keyed by a hash of the normalized student profile, the school and
+degree, the simulation settings, the version of the school_stats data, and the
+version of the chance model, so a cached chance is reused only while none of
+them change. Entries are stored
+in a SQLite file with an in-memory LRU in front of it, and the least recently
+used entries are evicted once either holds too many.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from columnar import ColumnarStore
+from database import DatabaseError
+from profiling import profile_execute, profile_fetchall
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEFAULT_CACHE_PATH = os.environ.get("CHANCE_CACHE", "chance_cache.db")
+
+USER_DATA_KEYS = ('GPA', 'Other GPA', 'Quant', 'Verbal', 'AW', 'LOR High', 'LOR Low', 'Research High',
+                  'Research Low', 'SOP High', 'SOP Low')
+
+# Version of the chance model math in chance.py and distributions.py. Bump it
+# whenever a change to them changes calculated chances, so cached chances from
+# the old model are not reused.
+CHANCE_MODEL_VERSION = 2
+
+# Disk entries are counted for eviction once per this many puts.
+EVICTION_INTERVAL = 256
+
+
+def chance_cache_open(path=DEFAULT_CACHE_PATH, max_entries=100000, memory_entries=1024):
+    """Opens the chance cache, creating its file if needed.
+
+    :param path: String path to the SQLite cache file.
+    :param max_entries: Int max number of entries kept on disk.
+    :param memory_entries: Int max number of entries kept in memory.
+    :return: Dict containing the chance cache.
+    """
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS chance_cache (
+            Key TEXT PRIMARY KEY,
+            Value TEXT NOT NULL,
+            Accessed REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS chance_cache_accessed ON chance_cache (Accessed);
+        """)
+
+    cache = {"Connection": connection,
+             "Memory": OrderedDict(),
+             "Max Entries": max_entries,
+             "Memory Entries": memory_entries,
+             "Puts": 0}
+
+    _chance_cache_evict(cache)
+
+    return cache
+
+
+def chance_cache_close(cache):
+    """Closes the chance cache file.
+
+    :param cache: Dict containing the chance cache.
+    :return:
+    """
+    cache["Connection"].close()
+
+
+def chance_cache_key(user_data, school_name, degree, settings, dataset_version):
+    """Hashes everything a calculated chance depends on.
+
+    :param user_data: Ordered Dictionary containing student profile data.
+    :param school_name: String school name.
+    :param degree: String degree, "PhD" or "MS".
+    :param settings: Dict of simulation settings, i.e. method and instances.
+    :param dataset_version: String version of the school_stats data.
+    :return: String cache key.
+    """
+    key_data = [[float(user_data[key]) for key in USER_DATA_KEYS], school_name, degree,
+                sorted(settings.items()), dataset_version, CHANCE_MODEL_VERSION]
+
+    return hashlib.sha256(json.dumps(key_data).encode('UTF-8')).hexdigest()
+
+
+def chance_cache_get(cache, key):
+    """Looks up a cached school data dict.
+
+    :param cache: Dict containing the chance cache.
+    :param key: String cache key.
+    :return: Dict containing school data and calculated chance, an empty dict
+             if the school and degree had no data, or None if not cached.
+    """
+    memory = cache["Memory"]
+
+    if key in memory:
+        memory.move_to_end(key)
+        return dict(memory[key])
+
+    cursor = cache["Connection"].execute("SELECT Value FROM chance_cache WHERE Key = ?", (key,))
+    row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    cache["Connection"].execute("UPDATE chance_cache SET Accessed = ? WHERE Key = ?", (time.time(), key))
+    cache["Connection"].commit()
+
+    value = json.loads(row[0])
+    _chance_cache_remember(cache, key, value)
+
+    return dict(value)
+
+
+def chance_cache_put(cache, key, school_data):
+    """Caches a school data dict.
+
+    :param cache: Dict containing the chance cache.
+    :param key: String cache key.
+    :param school_data: Dict containing school data and calculated chance, or
+                        an empty dict if the school and degree had no data.
+    :return:
+    """
+    value = json.loads(json.dumps(school_data, default=_json_number))
+    _chance_cache_remember(cache, key, value)
+
+    cache["Connection"].execute("INSERT OR REPLACE INTO chance_cache (Key, Value, Accessed) VALUES (?, ?, ?)",
+                                (key, json.dumps(value), time.time()))
+    cache["Connection"].commit()
+
+    cache["Puts"] += 1
+    if cache["Puts"] % EVICTION_INTERVAL == 0:
+        _chance_cache_evict(cache)
+
+
+def chance_dataset_version(db_connection):
+    """Gets the version of the school_stats data that calculated chances are based on.
+
+    Reads the version stamp written by school_stats_refresh. School statistics
+    refreshed before stamps were stored are hashed instead (see
+    chance_dataset_hash), until their next refresh.
+
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
+    :return: String version of the school_stats data.
+    """
+    if isinstance(db_connection, ColumnarStore):
+        return db_connection.version
+
+    cursor = db_connection.cursor()
+    try:
+        profile_execute("chance_dataset_version", cursor, "SELECT Version FROM school_stats_version")
+        row = cursor.fetchone()
+    except DatabaseError:
+        row = None
+    cursor.close()
+
+    if row is not None:
+        return row[0]
+
+    return chance_dataset_hash(db_connection)
+
+
+def chance_dataset_hash(db_connection):
+    """Fingerprints every row of the school_stats data.
+
+    :param db_connection: Database connection to csdata.
+    :return: String SHA-256 hex digest of the school_stats data.
+    """
+    cursor = db_connection.cursor()
+    profile_execute("chance_dataset_hash", cursor, "SELECT * FROM school_stats ORDER BY School, Degree")
+    rows = profile_fetchall("chance_dataset_hash", cursor)
+
+    # Every value of every row, and the column names, so any change to school_stats changes the version.
+    content_hash = hashlib.sha256(json.dumps([column[0] for column in cursor.description]).encode('UTF-8'))
+    for row in rows:
+        content_hash.update(json.dumps(list(row), default=_json_number).encode('UTF-8'))
+    cursor.close()
+
+    return content_hash.hexdigest()
+
+
+def _chance_cache_remember(cache, key, value):
+    memory = cache["Memory"]
+    memory[key] = value
+    memory.move_to_end(key)
+
+    while len(memory) > cache["Memory Entries"]:
+        memory.popitem(last=False)
+
+
+def _chance_cache_evict(cache):
+    connection = cache["Connection"]
+    num_entries = connection.execute("SELECT COUNT(*) FROM chance_cache").fetchone()[0]
+
+    if num_entries > cache["Max Entries"]:
+        connection.execute("DELETE FROM chance_cache WHERE Key IN "
+                           "(SELECT Key FROM chance_cache ORDER BY Accessed LIMIT ?)",
+                           (num_entries - cache["Max Entries"],))
+        connection.commit()
+
+
+def _json_number(value):
+    # Database drivers return DECIMAL values, and numpy its own scalars, which json can't encode.
+    if float(value).is_integer():
+        return int(value)
+
+    return float(value)
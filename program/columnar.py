@@ -0,0 +1,268 @@
+"""Columnar, memory-mapped copy of the csdata database.
+
+Each csdata column is stored as a typed NumPy array in its own .npy file and
+opened with memory mapping, so many worker processes share the same pages
+and no database server is needed:
+    - School, Degree, and Status are dictionary encoded as int32 codes.
+    - GPA and GRE scores are float64, with NaN for NULL.
+    - Rows are sorted by (School, Degree). An offsets index gives each school
+      and degree's row range, so its statistics come from array slices.
+
+A ColumnarStore can be passed to chance_calc, chance_matrix and
+school_directory_load in place of a database connection. Run this file to
+build the store from csdata.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from database import DEFAULT_SQLITE_PATH, DatabaseError, mysql_connect, sqlite_connect
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEFAULT_COLUMNAR_PATH = os.environ.get("CSDATA_COLUMNAR", "csdata_columnar")
+
+CODE_COLUMNS = ("School", "Degree", "Status")
+VALUE_COLUMNS = ("GPA", "GREV", "GREQ", "GRET", "GREAW")
+
+# school_stats average and std. dev. columns of each csdata column.
+STATS_COLUMNS = (("GPA", "GPA", "GPADev"),
+                 ("GREV", "Verbal", "VerbalDev"),
+                 ("GREQ", "Quant", "QuantDev"),
+                 ("GRET", "Combined", "CombinedDev"),
+                 ("GREAW", "AW", "AWDev"))
+
+
+class ColumnarStore:
+    """Memory-mapped columnar csdata, built by columnar_build."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "dictionary.json")) as file_open:
+            dictionary = json.load(file_open)
+
+        self.path = path
+        self.dictionary = dictionary
+        self.columns = {column: np.load(os.path.join(path, column + ".npy"), mmap_mode='r')
+                        for column in CODE_COLUMNS + VALUE_COLUMNS + ("Offsets",)}
+        self.programs = {(dictionary["School"][school], dictionary["Degree"][degree]): position
+                         for position, (school, degree) in enumerate(dictionary["Programs"])}
+
+        statuses = [status.lower() if status is not None else None for status in dictionary["Status"]]
+        self._accepted = [code for code, status in enumerate(statuses) if status == "accepted"]
+        self._rejected = [code for code, status in enumerate(statuses) if status == "rejected"]
+
+    @property
+    def version(self):
+        return self.dictionary["Version"]
+
+    def program_stats(self, school, degree):
+        """Aggregates one school and degree like a school_stats row.
+
+        :param school: String school name.
+        :param degree: String degree type.
+        :return: Dict containing the school_stats columns, or None if the
+                 school and degree have no rows.
+        """
+        position = self.programs.get((school, degree))
+
+        if position is None:
+            return None
+
+        start, end = self.columns["Offsets"][position:position + 2]
+        status = self.columns["Status"][start:end]
+        school_data = {"School": school,
+                       "Degree": degree,
+                       "Applicants": int(end - start),
+                       "Accepted": int(np.isin(status, self._accepted).sum()),
+                       "Rejected": int(np.isin(status, self._rejected).sum())}
+
+        for column, average_key, dev_key in STATS_COLUMNS:
+            values = self.columns[column][start:end]
+            count = int(np.count_nonzero(~np.isnan(values)))
+            school_data[average_key] = float(np.nanmean(values)) if count > 0 else None
+            school_data[dev_key] = float(np.nanstd(values, ddof=1)) if count > 1 else None
+
+        return school_data
+
+    def school_stats(self, programs=None):
+        """Aggregates schools and degrees like school_stats rows.
+
+        :param programs: Optional iterable of (School, Degree) tuples. All
+                         schools and degrees if not given.
+        :return: List of dicts containing the school_stats columns, ordered
+                 by school and degree.
+        """
+        if programs is None:
+            programs = self.programs
+
+        school_rows = [self.program_stats(school, degree) for school, degree in sorted(set(programs), key=_program_key)]
+
+        return [school_data for school_data in school_rows if school_data is not None]
+
+    def directory_rows(self):
+        """Counts each school's data like school_directory_load.
+
+        :return: List of dicts containing school counts.
+        """
+        counts = dict()
+        offsets = self.columns["Offsets"]
+
+        for (school, degree), position in self.programs.items():
+            start, end = offsets[position:position + 2]
+            school_counts = counts.setdefault(school, {"School": school, "Total": 0, "PhD": 0, "MS": 0,
+                                                       "QuantPhD": 0, "GPAPhD": 0, "QuantMS": 0, "GPAMS": 0})
+            school_counts["Total"] += int(end - start)
+
+            if degree in ("PhD", "MS"):
+                school_counts[degree] += int(end - start)
+                school_counts["Quant" + degree] += int(np.count_nonzero(~np.isnan(self.columns["GREQ"][start:end])))
+                school_counts["GPA" + degree] += int(np.count_nonzero(~np.isnan(self.columns["GPA"][start:end])))
+
+        return sorted(counts.values(), key=lambda school_counts: school_counts["Total"], reverse=True)
+
+    def close(self):
+        self.columns = dict()
+
+
+class ColumnarCursor:
+    """Read-only cursor over a list of dict rows."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self._rows
+
+
+def columnar_open(path=DEFAULT_COLUMNAR_PATH):
+    """Opens a columnar store.
+
+    :param path: String path to the store's directory.
+    :return: ColumnarStore of csdata.
+    """
+    return ColumnarStore(path)
+
+
+def columnar_build(db_connection, path=DEFAULT_COLUMNAR_PATH, batch_size=10000):
+    """Builds a columnar store from the csdata table.
+
+    csdata is read twice, once for each school and degree's row count and
+    once in batches to scatter rows into their (School, Degree) range, so
+    memory use is bounded by the batch size and the dictionaries.
+
+    :param db_connection: Database connection to csdata.
+    :param path: String path to the store's directory.
+    :param batch_size: Int number of rows read per batch.
+    :return: ColumnarStore of csdata.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    cursor = db_connection.cursor()
+    cursor.execute("SELECT School, Degree, COUNT(*) FROM csdata GROUP BY School, Degree")
+    program_counts = sorted(cursor.fetchall(), key=lambda row: _program_key(row[:2]))
+    cursor.close()
+
+    schools = sorted({row[0] for row in program_counts})
+    degrees = sorted({row[1] for row in program_counts}, key=lambda degree: (degree is None, degree or ""))
+    school_codes = {school: code for code, school in enumerate(schools)}
+    degree_codes = {degree: code for code, degree in enumerate(degrees)}
+    programs = [(school_codes[school], degree_codes[degree]) for school, degree, _ in program_counts]
+    program_positions = {(school, degree): position for position, (school, degree, _)
+                         in enumerate(program_counts)}
+
+    offsets = np.zeros(len(program_counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([int(row[2]) for row in program_counts])
+    num_rows = int(offsets[-1])
+    next_rows = offsets[:-1].copy()
+
+    columns = {column: np.lib.format.open_memmap(os.path.join(path, column + ".npy"), mode='w+', dtype=np.int32,
+                                                 shape=(num_rows,)) for column in CODE_COLUMNS}
+    columns.update({column: np.lib.format.open_memmap(os.path.join(path, column + ".npy"), mode='w+',
+                                                      dtype=np.float64, shape=(num_rows,))
+                    for column in VALUE_COLUMNS})
+    np.save(os.path.join(path, "Offsets.npy"), offsets)
+
+    statuses = []
+    status_codes = dict()
+    content_hash = hashlib.sha256()
+
+    cursor = db_connection.cursor()
+    cursor.execute("SELECT " + ", ".join(CODE_COLUMNS + VALUE_COLUMNS) + " FROM csdata ORDER BY ID")
+    rows = cursor.fetchmany(batch_size)
+
+    while rows:
+        positions = np.empty(len(rows), dtype=np.int64)
+
+        for number, row in enumerate(rows):
+            program = program_positions[(row[0], row[1])]
+            positions[number] = next_rows[program]
+            next_rows[program] += 1
+
+            if row[2] not in status_codes:
+                status_codes[row[2]] = len(statuses)
+                statuses.append(row[2])
+
+        columns["School"][positions] = [school_codes[row[0]] for row in rows]
+        columns["Degree"][positions] = [degree_codes[row[1]] for row in rows]
+        columns["Status"][positions] = [status_codes[row[2]] for row in rows]
+
+        for number, column in enumerate(VALUE_COLUMNS, 3):
+            columns[column][positions] = [np.nan if row[number] is None else float(row[number]) for row in rows]
+
+        content_hash.update(repr(rows).encode('UTF-8'))
+        rows = cursor.fetchmany(batch_size)
+
+    cursor.close()
+
+    for column in columns.values():
+        column.flush()
+
+    del columns
+
+    with open(os.path.join(path, "dictionary.json"), 'w') as file_open:
+        json.dump({"School": schools,
+                   "Degree": degrees,
+                   "Status": statuses,
+                   "Programs": programs,
+                   "Rows": num_rows,
+                   "Version": content_hash.hexdigest()}, file_open)
+
+    return ColumnarStore(path)
+
+
+def _program_key(program):
+    return program[0], program[1] is None, program[1] or ""
+
+
+if __name__ == "__main__":
+    try:
+        if os.path.exists(DEFAULT_SQLITE_PATH):
+            conn = sqlite_connect(DEFAULT_SQLITE_PATH)
+        else:
+            conn = mysql_connect(input("Please enter the root user MySQL password: "))
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+
+    else:
+        store = columnar_build(conn)
+        print("Built a columnar store of", store.dictionary["Rows"], "csdata rows in", store.path)
+        conn.close()
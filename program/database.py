@@ -0,0 +1,395 @@
+"""Database backends for the csdata database.
+
+MySQL connections are opened with pymysql. SQLite connections are wrapped so
+they can be passed anywhere a pymysql connection is expected by the query
+functions:
+    - Cursors accept pymysql-style %s placeholders.
+    - dict_cursor returns dict rows, like pymysql's DictCursor.
+    - STDDEV_SAMP is registered as an aggregate function.
+    - New databases are created with the csdata schema and its indexes on
+      School, Degree, and Status.
+A ConnectionPool (see database_pool) owns connection lifetimes: it keeps a
+few connections open for reuse across sessions and threads, and checks the
+health of a connection idle for a while before handing it out again.
+
+Run this file to copy the csdata MySQL database into a SQLite file.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pymysql
+except ImportError:
+    pymysql = None
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DEFAULT_SQLITE_PATH = os.environ.get("CSDATA_DB", "csdata.db")
+
+DEFAULT_POOL_SIZE = int(os.environ.get("CSDATA_POOL_SIZE", 4))
+
+CSDATA_COLUMNS = ("ID", "School", "Degree", "Status", "GPA", "GREV", "GREQ", "GRET", "GREAW")
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS csdata (
+        ID INTEGER PRIMARY KEY,
+        School TEXT NOT NULL,
+        Degree TEXT,
+        Status TEXT,
+        GPA REAL,
+        GREV REAL,
+        GREQ REAL,
+        GRET REAL,
+        GREAW REAL
+    );
+    CREATE INDEX IF NOT EXISTS csdata_school_degree ON csdata (School, Degree);
+    CREATE INDEX IF NOT EXISTS csdata_degree ON csdata (Degree);
+    CREATE INDEX IF NOT EXISTS csdata_status ON csdata (Status);
+    """
+
+if pymysql is None:
+    DatabaseError = sqlite3.Error
+else:
+    DatabaseError = (sqlite3.Error, pymysql.Error)
+
+
+class StdDevSamp:
+    """SQLite aggregate matching MySQL's STDDEV_SAMP.
+
+    Uses Welford's algorithm. NULLs are skipped and fewer than 2 values
+    give NULL.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if self.count < 2:
+            return None
+
+        return (self.m2 / (self.count - 1)) ** 0.5
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts pymysql-style %s placeholders."""
+
+    def __init__(self, cursor, dict_rows=False):
+        self._cursor = cursor
+
+        if dict_rows:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, query, args=None):
+        self._cursor.execute(query.replace("%s", "?"), args or ())
+        return self._cursor.rowcount
+
+    def executemany(self, query, args):
+        self._cursor.executemany(query.replace("%s", "?"), args)
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteConnection:
+    """sqlite3 connection usable in place of a pymysql connection."""
+
+    def __init__(self, path, read_only=False, shared=False):
+        if read_only:
+            self._connection = sqlite3.connect("file:" + path + "?mode=ro", uri=True, check_same_thread=not shared)
+        else:
+            self._connection = sqlite3.connect(path, check_same_thread=not shared)
+            self._connection.executescript(SQLITE_SCHEMA)
+
+        self._connection.create_aggregate("STDDEV_SAMP", 1, StdDevSamp)
+        self.path = path
+        self.read_only = read_only
+
+    def cursor(self, dict_rows=False):
+        return SQLiteCursor(self._connection.cursor(), dict_rows)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+class ConnectionPool:
+    """Fixed number of database connections shared between threads.
+
+    Connections are opened as needed, up to the pool size, and are used by
+    one thread at a time. A thread waits when all of them are in use. A
+    connection idle longer than check_interval seconds is health checked
+    before reuse and replaced if the check fails. A connection whose
+    rollback fails after an error is closed instead of being reused.
+    """
+
+    def __init__(self, connect, size, check_interval):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._connections = []
+        self._lock = threading.Lock()
+        self.size = size
+        self.check_interval = check_interval
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for a with block.
+
+        Example:
+            with pool.connection() as db_connection:
+                ...
+        """
+        self._slots.acquire()
+
+        try:
+            db_connection = self._checkout()
+            reusable = True
+
+            try:
+                yield db_connection
+            except BaseException:
+                try:
+                    db_connection.rollback()
+                except DatabaseError:
+                    reusable = False
+                raise
+            finally:
+                if reusable:
+                    self._idle.put((db_connection, time.monotonic()))
+                else:
+                    self._discard(db_connection)
+        finally:
+            self._slots.release()
+
+    def status(self):
+        """Counts the pool's connections.
+
+        :return: Dict with 'Size', 'Open', and 'Idle' connections.
+        """
+        with self._lock:
+            return {"Size": self.size, "Open": len(self._connections), "Idle": self._idle.qsize()}
+
+    def close(self):
+        with self._lock:
+            for db_connection in self._connections:
+                _close_quietly(db_connection)
+
+            self._connections = []
+            self._idle = queue.LifoQueue()
+
+    def _checkout(self):
+        while True:
+            try:
+                db_connection, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if time.monotonic() - idle_since <= self.check_interval or database_check(db_connection):
+                return db_connection
+
+            self._discard(db_connection)
+
+        db_connection = self._connect()
+
+        with self._lock:
+            self._connections.append(db_connection)
+
+        return db_connection
+
+    def _discard(self, db_connection):
+        with self._lock:
+            if db_connection in self._connections:
+                self._connections.remove(db_connection)
+
+        _close_quietly(db_connection)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def sqlite_connect(path=DEFAULT_SQLITE_PATH, read_only=False, shared=False):
+    """Connects to a SQLite csdata database, creating its schema if needed.
+
+    :param path: String path to the SQLite database file.
+    :param read_only: Bool to open the file read-only, i.e. for workers.
+    :param shared: Bool to allow the connection to be used from threads
+                   other than the one that opened it, one at a time.
+    :return: SQLiteConnection to csdata.
+    """
+    return SQLiteConnection(path, read_only, shared)
+
+
+def database_pool(connect, size=DEFAULT_POOL_SIZE, check_interval=30.0):
+    """Creates a pool of connections shared between sessions and threads.
+
+    Example:
+        pool = database_pool(lambda: sqlite_connect(path, read_only=True, shared=True))
+
+    :param connect: Function without arguments opening a connection.
+    :param size: Int maximum number of open connections. Defaults to the
+                 CSDATA_POOL_SIZE environment variable, or 4.
+    :param check_interval: Float seconds a connection can be idle before it
+                           is health checked on reuse.
+    :return: ConnectionPool.
+    """
+    return ConnectionPool(connect, size, check_interval)
+
+
+def database_check(db_connection):
+    """Checks that a connection still answers queries.
+
+    :param db_connection: Database connection to csdata.
+    :return: Bool, true when healthy.
+    """
+    try:
+        cursor = db_connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+    except DatabaseError:
+        return False
+
+    return True
+
+
+def mysql_connect(password, host='localhost', user='root', database='csdata'):
+    """Connects to the csdata MySQL database.
+
+    :param password: String MySQL password.
+    :param host: String MySQL host.
+    :param user: String MySQL user.
+    :param database: String MySQL database name.
+    :return: pymysql connection to csdata.
+    """
+    if pymysql is None:
+        raise ImportError("pymysql is required for the MySQL backend")
+
+    return pymysql.connect(host=host,
+                           database=database,
+                           user=user,
+                           password=password)
+
+
+def dict_cursor(db_connection):
+    """Opens a cursor returning rows as dicts keyed by column name.
+
+    :param db_connection: Database connection to csdata.
+    :return: Cursor with dict rows.
+    """
+    if isinstance(db_connection, SQLiteConnection):
+        return db_connection.cursor(dict_rows=True)
+
+    return db_connection.cursor(pymysql.cursors.DictCursor)
+
+
+def sqlite_copy_csdata(source_connection, db_connection, batch_size=10000):
+    """Copies the csdata table from another connection, i.e. MySQL, to SQLite.
+
+    :param source_connection: Database connection to copy csdata from.
+    :param db_connection: SQLiteConnection to copy csdata to.
+    :param batch_size: Int number of rows copied per batch.
+    :return: Int number of rows copied.
+    """
+    source_cursor = source_connection.cursor()
+    source_cursor.execute("SELECT " + ", ".join(CSDATA_COLUMNS) + " FROM csdata")
+
+    cursor = db_connection.cursor()
+    cursor.execute("DELETE FROM csdata")
+    insert_query = "INSERT INTO csdata (" + ", ".join(CSDATA_COLUMNS) + ") VALUES (" \
+                   + ", ".join(["%s"] * len(CSDATA_COLUMNS)) + ")"
+    copied = 0
+
+    rows = source_cursor.fetchmany(batch_size)
+    while rows:
+        cursor.executemany(insert_query, [[_sqlite_value(value) for value in row] for row in rows])
+        copied += len(rows)
+        rows = source_cursor.fetchmany(batch_size)
+
+    db_connection.commit()
+
+    return copied
+
+
+def _close_quietly(db_connection):
+    try:
+        db_connection.close()
+    except DatabaseError:
+        pass
+
+
+def _sqlite_value(value):
+    # MySQL DECIMAL columns arrive as decimal.Decimal, which sqlite3 can't bind.
+    if value is not None and not isinstance(value, (int, float, str, bytes)):
+        return float(value)
+
+    return value
+
+
+if __name__ == "__main__":
+    from school_stats import school_stats_refresh
+
+    mysql_password = input("Please enter the root user MySQL password: ")
+
+    try:
+        mysql_conn = mysql_connect(mysql_password)
+        sqlite_conn = sqlite_connect()
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+
+    else:
+        print("Copied", sqlite_copy_csdata(mysql_conn, sqlite_conn), "rows to", sqlite_conn.path)
+        print("Refreshed school_stats with", school_stats_refresh(sqlite_conn), "school and degree rows.")
+        mysql_conn.close()
+        sqlite_conn.close()
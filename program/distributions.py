@@ -0,0 +1,142 @@
+"""Normal and binomial distribution functions used by chance calculations.
+
+Importing scipy.stats takes about a second, which dominated the run time of
+short CLI calls and new worker processes, so this module avoids it:
+    - Scalar normal quantiles and CDFs use the standard library
+      (statistics.NormalDist and math.erfc).
+    - Step 7 only takes quantiles of integer percentiles 0 to 100, so those
+      come from the precomputed PERCENTILE_Z table.
+    - Binomial quantiles of step 4 are summed from the probability mass
+      function in pure Python.
+    - scipy.special is imported on the first call of normal_cdf_array, for
+      the vectorized simulation methods.
+"""
+
+import math
+from statistics import NormalDist
+import numpy as np
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+# Standard normal quantile (z-score) of each integer percentile 0 to 100, i.e. PERCENTILE_Z[90] = 1.2816.
+PERCENTILE_Z = np.array([
+    -np.inf, -2.3263478740408408, -2.053748910631823, -1.880793608151251, -1.75068607125217, -1.6448536269514729,
+    -1.5547735945968535, -1.4757910281791706, -1.4050715603096329, -1.3407550336902165, -1.2815515655446004,
+    -1.2265281200366098, -1.1749867920660904, -1.1263911290388007, -1.0803193408149558, -1.0364333894937898,
+    -0.994457883209753, -0.9541652531461943, -0.915365087842814, -0.8778962950512288, -0.8416212335729142,
+    -0.8064212470182404, -0.7721932141886848, -0.7388468491852137, -0.7063025628400874, -0.6744897501960817,
+    -0.643345405392917, -0.6128129910166272, -0.5828415072712162, -0.5533847195556729, -0.5244005127080409,
+    -0.4958503473474533, -0.46769879911450823, -0.4399131656732338, -0.41246312944140473, -0.38532046640756773,
+    -0.3584587932511938, -0.33185334643681663, -0.3054807880993974, -0.27931903444745415, -0.2533471031357997,
+    -0.22754497664114948, -0.20189347914185088, -0.17637416478086135, -0.15096921549677725, -0.12566134685507402,
+    -0.10043372051146975, -0.0752698620998299, -0.05015358346473367, -0.02506890825871106, 0.0, 0.02506890825871106,
+    0.05015358346473367, 0.0752698620998299, 0.10043372051146988, 0.12566134685507416, 0.1509692154967774,
+    0.1763741647808612, 0.20189347914185074, 0.22754497664114934, 0.2533471031357997, 0.27931903444745415,
+    0.3054807880993974, 0.33185334643681663, 0.3584587932511938, 0.38532046640756773, 0.41246312944140495,
+    0.4399131656732339, 0.4676987991145084, 0.4958503473474532, 0.5244005127080407, 0.5533847195556727,
+    0.5828415072712162, 0.6128129910166272, 0.643345405392917, 0.6744897501960817, 0.7063025628400874,
+    0.7388468491852137, 0.7721932141886848, 0.8064212470182404, 0.8416212335729143, 0.8778962950512289,
+    0.9153650878428138, 0.9541652531461943, 0.994457883209753, 1.0364333894937898, 1.0803193408149558,
+    1.1263911290388007, 1.1749867920660904, 1.2265281200366105, 1.2815515655446004, 1.3407550336902165,
+    1.4050715603096329, 1.475791028179171, 1.5547735945968535, 1.6448536269514722, 1.7506860712521692,
+    1.8807936081512509, 2.0537489106318225, 2.3263478740408408, np.inf])
+
+# Relative tolerance of binomial quantiles, so a CDF equal to q up to rounding still counts as reaching it.
+BINOM_TOLERANCE = 1e-12
+
+_standard_normal = NormalDist()
+
+
+def normal_ppf(p):
+    """Standard normal quantile (inverse CDF).
+
+    :param p: Float probability from 0 to 1.
+    :return: Float z-score, -inf for 0 and inf for 1.
+    """
+    if p <= 0:
+        return -math.inf
+    if p >= 1:
+        return math.inf
+
+    return _standard_normal.inv_cdf(p)
+
+
+def normal_cdf(x, mean=0.0, stdev=1.0):
+    """Normal CDF of a scalar.
+
+    :param x: Float value.
+    :param mean: Float mean of the distribution.
+    :param stdev: Float standard deviation of the distribution.
+    :return: Float probability from 0 to 1.
+    """
+    return 0.5 * math.erfc((mean - x) / (stdev * math.sqrt(2)))
+
+
+def normal_cdf_array(x):
+    """Standard normal CDF of an array, with scipy.special.ndtr.
+
+    :param x: Array of z-scores.
+    :return: Array of probabilities from 0 to 1.
+    """
+    from scipy.special import ndtr
+
+    return ndtr(x)
+
+
+def binom_ppf(q, n, p):
+    """Binomial quantile, matching scipy.stats.binom.ppf.
+
+    :param q: Float lower tail probability.
+    :param n: Number of trials.
+    :param p: Float success probability.
+    :return: Float, the smallest k with CDF(k) >= q.
+    """
+    cumulative = 0.0
+
+    for k, mass in enumerate(_binom_pmf(n, p)):
+        cumulative += mass
+
+        if cumulative >= q * (1 - BINOM_TOLERANCE):
+            return float(k)
+
+    return float(int(n))
+
+
+def binom_isf(q, n, p):
+    """Binomial inverse survival function, matching scipy.stats.binom.isf.
+
+    :param q: Float upper tail probability.
+    :param n: Number of trials.
+    :param p: Float success probability.
+    :return: Float, the smallest k with P(X > k) <= q.
+    """
+    masses = _binom_pmf(n, p)
+    survival = 0.0
+    smallest = len(masses) - 1
+
+    for k in range(len(masses) - 1, -1, -1):
+        if survival > q * (1 + BINOM_TOLERANCE):
+            break
+
+        smallest = k
+        survival += masses[k]
+
+    return float(smallest)
+
+
+def _binom_pmf(n, p):
+    n = int(n)
+    log_p = math.log(p)
+    log_q = math.log1p(-p)
+    log_n = math.lgamma(n + 1)
+
+    return [math.exp(log_n - math.lgamma(k + 1) - math.lgamma(n - k + 1) + k * log_p + (n - k) * log_q)
+            for k in range(n + 1)]
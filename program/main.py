@@ -19,12 +19,17 @@ Program Structure:
     organized by ranking.
 """
 
-from pymysql import connect, Error
+import os
 from data.test_user_school_data import test_user_data
+from database import DEFAULT_SQLITE_PATH, DatabaseError, database_pool, mysql_connect, sqlite_connect
 from chance import chance_calc
+from chance_cache import chance_cache_open
 from school_data_io import school_data_in
+from school_directory import school_directory_load
 from user_data_io import user_data_in, user_data_print
-from optimize import optimize_overall_calc, optimize_print
+from optimize import optimize_overall_calc, optimize_print, optimize_state_add, optimize_state_init, \
+    optimize_state_remove
+from profiling import profile_enabled, profile_json
 
 __author__ = "Jacob Lydon"
 __copyright__ = "Copyright 2017"
@@ -36,45 +41,88 @@ __maintainer__ = "Jacob Lydon"
 __email__ = "jlydon001@regis.edu"
 __status__ = "Development"
 
-password = input("Please enter the root user MySQL password: ")
+# A local SQLite csdata file (see database.py) is used when present. Otherwise the MySQL password is read from
+# CSDATA_MYSQL_PASSWORD, like batch.py and service.py, before falling back to a prompt.
+if os.path.exists(DEFAULT_SQLITE_PATH):
+    password = None
+else:
+    password = os.environ.get("CSDATA_MYSQL_PASSWORD") or input("Please enter the root user MySQL password: ")
+
+directory = None
+cache = chance_cache_open()
+
+
+def connect():
+    """ Connect to SQLite or MySQL database """
+    if password is None:
+        return sqlite_connect(DEFAULT_SQLITE_PATH)
+    else:
+        return mysql_connect(password)
+
+
+# One pooled connection is reused by every restart, and reopened if it stops answering.
+pool = database_pool(connect, 1)
 
 while True:
-    """ Connect to MySQL database """
     try:
-        conn = connect(host='localhost',
-                       database='csdata',
-                       user='root',
-                       password=password)
+        with pool.connection() as conn:
+            print("On your first try, please use our test student profile and schools to get a feel for the "
+                  "program\nbecause there is quite a bit of data entry. The test student has a good profile and is "
+                  "considering\n16 schools. You may also add additional schools to the test school list.\n")
 
-    except Error as e:
-        print(e, "\nNo database connection. Please restart to try again.")
+            if input("Type 'test' to use the test profile (or any other key): ").lower() == "test":
+                user_data = test_user_data()
+            else:
+                user_data = user_data_in()
 
-    else:
-        print("On your first try, please use our test student profile and schools to get a feel for the program\n"
-              "because there is quite a bit of data entry. The test student has a good profile and is considering\n"
-              "16 schools. You may also add additional schools to the test school list.\n")
+            user_data_print(user_data)
+
+            if directory is None:
+                directory = school_directory_load(conn)
+
+            if input("\nType 'test' to use the test school list (or any other key): ").lower() == "test":
+                schools_consider = school_data_in(conn, True, directory)
+            else:
+                schools_consider = school_data_in(conn, False, directory)
+
+            schools_consider = chance_calc(conn, user_data, schools_consider, cache=cache)
 
-        if input("Type 'test' to use the test profile (or any other key): ").lower() == "test":
-            user_data = test_user_data()
-        else:
-            user_data = user_data_in()
+            # The optimization state answers new chance parameters and school edits without starting over.
+            optimize_state = optimize_state_init(schools_consider)
 
-        user_data_print(user_data)
+            while True:
+                optimize_schools = optimize_overall_calc(optimize_state["Schools"], method="frontier",
+                                                         state=optimize_state)
 
-        if input("\nType 'test' to use the test school list (or any other key): ").lower() == "test":
-            schools_consider = school_data_in(conn, True)
-        else:
-            schools_consider = school_data_in(conn, False)
+                optimize_print(optimize_schools)
 
-        schools_consider = chance_calc(conn, user_data, schools_consider)
+                edit = input("\nEnter 'Y' to try different chance parameters, 'A' to add schools, or 'D' to drop a "
+                             "school (or any other key): ").lower()
 
-        while True:
-            optimize_schools = optimize_overall_calc(schools_consider)
+                if edit == "a":
+                    for school in chance_calc(conn, user_data, school_data_in(conn, False, directory), cache=cache):
+                        optimize_state_add(optimize_state, school)
+                elif edit == "d":
+                    drop_name = input("Enter the name of the school to drop: ").lower()
+                    drop_schools = [school for school in optimize_state["Schools"]
+                                    if school['Name'].lower() == drop_name]
+
+                    if drop_schools:
+                        optimize_state_remove(optimize_state, drop_schools[0])
+                    else:
+                        print("No school with that name is under consideration.")
+                elif edit not in ["y"]:
+                    break
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+        break
 
-            optimize_print(optimize_schools)
+    if input("\nEnter 'Y' to try restart the program (or any other key): ").lower() not in ["y"]:
+        break
 
-            if input("\nEnter 'Y' to try different chance parameters (or any other key): ").lower() not in ["y"]:
-                break
+pool.close()
 
-        if input("\nEnter 'Y' to try restart the program (or any other key): ").lower() not in ["y"]:
-            break
+# Set CSGRAD_PROFILE to print where the time went (see profiling.py).
+if profile_enabled():
+    print(profile_json())
@@ -1,8 +1,14 @@
 """Optimizes the schools to which a user should apply."""
 
 import itertools
+from bisect import bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, comb, log
 from operator import itemgetter
+import os
+import numpy as np
 from helper import float_in_range, int_in_range
+from profiling import profile_count, profile_span
 
 __author__ = "Jacob Lydon"
 __copyright__ = "Copyright 2017"
@@ -128,11 +134,11 @@ def optimize_print(school_list_calcd):
         print("\nNo set of schools satisfied your requirements.")
 
 
-def optimize_overall_calc(schools_consider):
+def optimize_overall_calc(schools_consider, params=None, method="branch_and_bound", workers=None, state=None):
     """Calculates the optimal set of schools in which to apply, given student
     school rankings and optimization parameters.
 
-    Algorithm:
+    Algorithm ("exhaustive" method):
     1.  Get all possible school combinations.
     2.  For each combination:
         2a. Calc the chance of being accepted to at least 1 school in combo.
@@ -140,10 +146,129 @@ def optimize_overall_calc(schools_consider):
         2c. Store the combo with an average rating that exceeds both chance
             thresholds and the previous optimal average rating.
 
+    The default "branch_and_bound" method returns the same set without
+    enumerating every combination (see optimize_branch_and_bound_search).
+    The "parallel" method runs the exhaustive search across processes (see
+    optimize_parallel_search) and the "vectorized" method runs it on NumPy
+    arrays (see optimize_vectorized_search). The "frontier" method looks the
+    set up in the Pareto frontier of schools_consider (see
+    optimize_frontier_calc), which answers any Chance Threshold, Num Apps, and
+    Threshold Mod for the same Chance Mod without searching again. Frontiers
+    are kept in an optimization state (see optimize_state_init) that can be
+    reused across calls and updated as schools are added or removed.
+
     :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters. Input by the user if not given.
+    :param method: Search method, "branch_and_bound", "exhaustive", "parallel",
+                   "vectorized", or "frontier".
+    :param workers: Int number of worker processes for the "parallel" method.
+                    Defaults to the number of CPUs.
+    :param state: Dict containing the optimization state for the "frontier"
+                  method. Its schools are used in place of schools_consider.
     :return: Dict containing optimized set of schools and data.
     """
-    params = optimize_input(len(schools_consider))
+    if method not in ("branch_and_bound", "exhaustive", "parallel", "vectorized", "frontier"):
+        raise ValueError("Unknown optimize method: " + str(method))
+
+    if params is None:
+        params = optimize_input(len(schools_consider))
+
+    with profile_span("optimize.search." + method):
+        if method == "exhaustive":
+            school_list_calcd = optimize_exhaustive_search(schools_consider, params)
+        elif method == "parallel":
+            school_list_calcd = optimize_parallel_search(schools_consider, params, workers)
+        elif method == "vectorized":
+            school_list_calcd = optimize_vectorized_search(schools_consider, params)
+        elif method == "frontier":
+            if state is None:
+                state = optimize_state_init(schools_consider)
+            school_list_calcd = optimize_state_search(state, params)
+        else:
+            school_list_calcd = optimize_branch_and_bound_search(schools_consider, params)
+
+    if method in ("exhaustive", "parallel", "vectorized") and 0 <= params['Num Apps'] <= len(schools_consider):
+        profile_count("optimize.combinations", comb(len(schools_consider), params['Num Apps']))
+
+    if school_list_calcd['Best Score'] > 0:
+        school_list_calcd['Best Schools'] = sorted(school_list_calcd['Best Schools'],
+                                                   key=itemgetter('Rank'), reverse=True)
+
+        with profile_span("optimize.tier_calc"):
+            school_list_calcd = optimize_tier_calc(school_list_calcd)
+
+    return school_list_calcd
+
+
+def optimize_combo_calc(combo, params):
+    """Calculates the average rating and chances of one combination.
+
+    :param combo: Tuple of schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :return: Tuple of average rating, chance, mod chance, total chance incl.
+             backup, and mod total chance incl. backup.
+    """
+    running_sum_rank = 0.0
+    running_chance = 1.0
+    running_mod_chance = 1.0
+    running_chance_including_backup = 1.0
+    running_mod_chance_including_backup = 1.0
+
+    # Algorithm Step 2a.
+    for school in combo:
+        running_sum_rank += school['Rank']
+
+        if school['PhD'] == "Yes":
+            phd_chance = school['PhD Chance']
+        else:
+            phd_chance = 0
+
+        if school['MS'] == "Yes":
+            ms_chance = school['MS Chance']
+        else:
+            ms_chance = 0
+
+        if school['PhD'] == "Yes":
+            running_chance *= 1 - phd_chance
+            running_mod_chance *= 1 - (phd_chance * params['Chance Mod'])
+        else:
+            running_chance *= 1 - ms_chance
+            running_mod_chance *= 1 - (ms_chance * params['Chance Mod'])
+
+        running_chance_including_backup *= 1 - (phd_chance + ((1 - phd_chance) * ms_chance))
+        running_mod_chance_including_backup \
+            *= 1 - (phd_chance + ((1 - phd_chance) * ms_chance * params['Chance Mod']))
+
+    # Algorithm Step 2b.
+    average = running_sum_rank / len(combo)
+
+    return average, 1 - running_chance, 1 - running_mod_chance, 1 - running_chance_including_backup, \
+        1 - running_mod_chance_including_backup
+
+
+def optimize_combo_store(school_list_calcd, combo, combo_calcs):
+    """Stores a combination as the optimal set of schools.
+
+    :param school_list_calcd: Dict containing optimized set of schools and data.
+    :param combo: Tuple of schools, with data and calculated chance.
+    :param combo_calcs: Tuple of calcs from optimize_combo_calc.
+    :return:
+    """
+    school_list_calcd['Best Score'] = combo_calcs[0]
+    school_list_calcd['Best Chance'] = combo_calcs[1]
+    school_list_calcd['Best Total Chance'] = combo_calcs[3]
+    school_list_calcd['Mod Best Chance'] = combo_calcs[2]
+    school_list_calcd['Mod Best Total Chance'] = combo_calcs[4]
+    school_list_calcd['Best Schools'] = combo
+
+
+def optimize_exhaustive_search(schools_consider, params):
+    """Finds the optimal set of schools by evaluating every combination.
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
     school_list_calcd = {"Best Score": 0,
                          "Best Chance": 0,
                          "Best Total Chance": 0,
@@ -151,68 +276,689 @@ def optimize_overall_calc(schools_consider):
                          "Mod Best Total Chance": 0}
 
     # Algorithm Step 1.
-    school_combinations = list(itertools.combinations(iter(schools_consider), params['Num Apps']))
+    with profile_span("optimize.step_1"):
+        school_combinations = list(itertools.combinations(iter(schools_consider), params['Num Apps']))
 
     # Algorithm Step 2.
-    for combo in school_combinations:
-        running_sum_rank = 0.0
-        running_chance = 1.0
-        running_mod_chance = 1.0
-        running_chance_including_backup = 1.0
-        running_mod_chance_including_backup = 1.0
+    with profile_span("optimize.step_2"):
+        for combo in school_combinations:
+            combo_calcs = optimize_combo_calc(combo, params)
 
-        # Algorithm Step 2a.
-        for school in combo:
-            running_sum_rank += school['Rank']
+            # Algorithm Step 2c.
+            if combo_calcs[1] > params['Chance Threshold'] and combo_calcs[0] > school_list_calcd['Best Score'] \
+                    and combo_calcs[4] > params['Threshold Mod']:
+                optimize_combo_store(school_list_calcd, combo, combo_calcs)
 
-            if school['PhD'] == "Yes":
-                phd_chance = school['PhD Chance']
-            else:
-                phd_chance = 0
+    return school_list_calcd
 
-            if school['MS'] == "Yes":
-                ms_chance = school['MS Chance']
-            else:
-                ms_chance = 0
 
-            if school['PhD'] == "Yes":
-                running_chance *= 1 - phd_chance
-                running_mod_chance *= 1 - (phd_chance * params['Chance Mod'])
-            else:
-                running_chance *= 1 - ms_chance
-                running_mod_chance *= 1 - (ms_chance * params['Chance Mod'])
-
-            running_chance_including_backup *= 1 - (phd_chance + ((1 - phd_chance) * ms_chance))
-            running_mod_chance_including_backup \
-                *= 1 - (phd_chance + ((1 - phd_chance) * ms_chance * params['Chance Mod']))
-
-        chance = 1 - running_chance
-        mod_chance = 1 - running_mod_chance
-        total_chance = 1 - running_chance_including_backup
-        mod_total_chance = 1 - running_mod_chance_including_backup
-
-        # Algorithm Step 2b.
-        average = running_sum_rank / len(combo)
-
-        # Algorithm Step 2c.
-        if chance > params['Chance Threshold'] and average > school_list_calcd['Best Score'] \
-                and mod_total_chance > params['Threshold Mod']:
-            school_list_calcd['Best Score'] = average
-            school_list_calcd['Best Chance'] = chance
-            school_list_calcd['Best Total Chance'] = total_chance
-            school_list_calcd['Mod Best Chance'] = mod_chance
-            school_list_calcd['Mod Best Total Chance'] = mod_total_chance
-            school_list_calcd['Best Schools'] = combo
+def optimize_parallel_search(schools_consider, params, workers=None):
+    """Finds the optimal set of schools by evaluating every combination across
+    worker processes.
 
-    if school_list_calcd['Best Score'] > 0:
-        school_list_calcd['Best Schools'] = sorted(school_list_calcd['Best Schools'],
-                                                   key=itemgetter('Rank'), reverse=True)
+    The combinations are numbered in itertools.combinations order and split
+    into contiguous ranges. Each worker starts at the first combination of its
+    range and steps through the rest without materializing them, keeping the
+    first best set in its range. Merging keeps the best set from the earliest
+    range, which is the same set optimize_exhaustive_search returns.
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :param workers: Int number of worker processes. Defaults to the number of CPUs.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
+    school_list_calcd = {"Best Score": 0,
+                         "Best Chance": 0,
+                         "Best Total Chance": 0,
+                         "Mod Best Chance": 0,
+                         "Mod Best Total Chance": 0}
+    num_apps = params['Num Apps']
+    num_combos = comb(len(schools_consider), num_apps)
+
+    if num_apps < 1 or num_combos == 0:
+        return school_list_calcd
+
+    workers = workers or os.cpu_count() or 1
+    # Several ranges per worker keep the workers busy when ranges prune unevenly.
+    num_ranges = min(num_combos, workers * 4)
+    range_starts = [num_combos * number // num_ranges for number in range(num_ranges + 1)]
+    combo_ranges = list(zip(range_starts[:-1], range_starts[1:]))
+    school_fields = [{key: school[key] for key in ('Rank', 'PhD', 'MS', 'PhD Chance', 'MS Chance') if key in school}
+                     for school in schools_consider]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_parallel_init,
+                             initargs=(school_fields, params)) as executor:
+        range_bests = list(executor.map(_parallel_range_search, combo_ranges))
+
+    for range_best in range_bests:
+        if range_best is not None and range_best[1][0] > school_list_calcd['Best Score']:
+            optimize_combo_store(school_list_calcd, tuple(schools_consider[index] for index in range_best[0]),
+                                 range_best[1])
+
+    return school_list_calcd
+
+
+_parallel_schools = None
+_parallel_params = None
+
+
+def _parallel_init(school_fields, params):
+    global _parallel_schools, _parallel_params
+    _parallel_schools = school_fields
+    _parallel_params = params
+
+
+def _parallel_range_search(combo_range):
+    num_schools = len(_parallel_schools)
+    num_apps = _parallel_params['Num Apps']
+    indices = _combination_unrank(combo_range[0], num_schools, num_apps)
+    best = None
+    best_score = 0
+
+    for combo_number in range(combo_range[0], combo_range[1]):
+        combo_calcs = optimize_combo_calc([_parallel_schools[index] for index in indices], _parallel_params)
+
+        if combo_calcs[1] > _parallel_params['Chance Threshold'] and combo_calcs[0] > best_score \
+                and combo_calcs[4] > _parallel_params['Threshold Mod']:
+            best_score = combo_calcs[0]
+            best = (tuple(indices), combo_calcs)
+
+        _combination_next(indices, num_schools)
+
+    return best
+
+
+def _combination_unrank(rank, n, k):
+    # The rank-th k-combination of range(n) in lexicographic order.
+    indices = []
+    candidate = 0
+
+    for slot in range(k):
+        while rank >= comb(n - candidate - 1, k - slot - 1):
+            rank -= comb(n - candidate - 1, k - slot - 1)
+            candidate += 1
+        indices.append(candidate)
+        candidate += 1
+
+    return indices
+
+
+def _combination_next(indices, n):
+    # Advances indices in place to the next k-combination of range(n).
+    k = len(indices)
+    slot = k - 1
+
+    while slot >= 0 and indices[slot] == n - k + slot:
+        slot -= 1
+
+    if slot < 0:
+        return False
+
+    indices[slot] += 1
+    for later_slot in range(slot + 1, k):
+        indices[later_slot] = indices[later_slot - 1] + 1
+
+    return True
+
+
+def optimize_vectorized_search(schools_consider, params, chunk_size=65536):
+    """Finds the optimal set of schools by evaluating every combination in
+    chunks of NumPy arrays.
+
+    The per-school no-acceptance factors the thresholds depend on (chance and
+    mod chance incl. backup) are precomputed as logs, so a combination's
+    chances come from a gather and a sum over its index array. Each chunk of combinations
+    is scored at once, and the first combination with the best qualifying
+    average rating is found with a masked argmax. Average ratings are summed
+    in the same order as optimize_exhaustive_search; chances in log space can
+    differ from it in the last digits. The best set's reported chances are
+    recalculated with optimize_combo_calc.
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :param chunk_size: Int number of combinations scored per chunk.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
+    school_list_calcd = {"Best Score": 0,
+                         "Best Chance": 0,
+                         "Best Total Chance": 0,
+                         "Mod Best Chance": 0,
+                         "Mod Best Total Chance": 0}
+    num_apps = params['Num Apps']
+
+    if num_apps < 1 or num_apps > len(schools_consider):
+        return school_list_calcd
+
+    ranks = np.array([school['Rank'] for school in schools_consider], dtype=float)
+    no_chance = []
+    mod_no_total_chance = []
+
+    for school in schools_consider:
+        phd_chance = school['PhD Chance'] if school['PhD'] == "Yes" else 0
+        ms_chance = school['MS Chance'] if school['MS'] == "Yes" else 0
+        chance = phd_chance if school['PhD'] == "Yes" else ms_chance
+
+        no_chance.append(1 - chance)
+        mod_no_total_chance.append(1 - (phd_chance + ((1 - phd_chance) * ms_chance * params['Chance Mod'])))
+
+    no_chance_logs = _log_factors(no_chance)
+    mod_no_total_chance_logs = _log_factors(mod_no_total_chance)
+
+    combinations = itertools.combinations(range(len(schools_consider)), num_apps)
+    best_combo = None
+
+    while True:
+        combo_indices = np.fromiter(itertools.chain.from_iterable(itertools.islice(combinations, chunk_size)),
+                                    dtype=np.intp).reshape(-1, num_apps)
+        if len(combo_indices) == 0:
+            break
+
+        gathered_ranks = ranks[combo_indices]
+        rank_sum = gathered_ranks[:, 0].copy()
+        for slot in range(1, num_apps):
+            rank_sum += gathered_ranks[:, slot]
+        average = rank_sum / num_apps
+
+        chance = 1 - _log_factors_product(no_chance_logs, combo_indices)
+        mod_total_chance = 1 - _log_factors_product(mod_no_total_chance_logs, combo_indices)
+
+        qualified = (chance > params['Chance Threshold']) & (mod_total_chance > params['Threshold Mod']) \
+            & (average > school_list_calcd['Best Score'])
+
+        if qualified.any():
+            position = np.argmax(np.where(qualified, average, -np.inf))
+            school_list_calcd['Best Score'] = average[position]
+            best_combo = tuple(schools_consider[index] for index in combo_indices[position])
+
+    if best_combo is not None:
+        optimize_combo_store(school_list_calcd, best_combo, optimize_combo_calc(best_combo, params))
+
+    return school_list_calcd
+
+
+def _log_factors(factors):
+    # Logs of absolute values plus signs, so products of negative factors (a large Chance Mod) keep their sign.
+    factors = np.array(factors, dtype=float)
+
+    with np.errstate(divide='ignore'):
+        return np.log(np.abs(factors)), factors < 0
 
-        school_list_calcd = optimize_tier_calc(school_list_calcd)
+
+def _log_factors_product(log_factors, combo_indices):
+    logs, negative = log_factors
+    sign = np.where(negative[combo_indices].sum(axis=1) % 2 == 1, -1.0, 1.0)
+
+    return sign * np.exp(logs[combo_indices].sum(axis=1))
+
+
+def optimize_frontier_calc(schools_consider, chance_mod, max_apps=None):
+    """Calculates the Pareto frontier of school sets for every number of
+    applications.
+
+    A set is on the frontier unless another set of the same size has at least
+    its rating sum, chance, and mod total chance (incl. backup), and either a
+    higher rating sum or an earlier place in combination order. The optimal
+    set for any Chance Threshold, Threshold Mod, and Num Apps is therefore on
+    the frontier for that Num Apps.
+
+    Algorithm:
+    1.  Start with the empty set.
+    2.  For each school, in order, extend the frontier (see
+        optimize_frontier_add).
+
+    Rating sums and chance products are accumulated in the same order as
+    optimize_combo_calc, so lookups match optimize_exhaustive_search exactly.
+    The frontier of every prefix of schools_consider is kept, so a school can
+    be removed by extending the frontier before it with the schools after it
+    (see optimize_frontier_remove).
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param chance_mod: Float Chance Mod optimization parameter.
+    :param max_apps: Int largest number of applications kept. Defaults to all.
+    :return: Dict containing the frontier, keyed by number of applications, of
+             (rating sum, no-acceptance chance, mod no-acceptance chance incl.
+             backup, school indices) tuples.
+    """
+    # Algorithm Step 1.
+    frontier = {"Schools": [],
+                "Chance Mod": chance_mod,
+                "Max Apps": len(schools_consider) if max_apps is None else max_apps,
+                "Bounded": True,
+                "Frontier": dict(),
+                "Prefixes": [dict()]}
+
+    # Algorithm Step 2.
+    for school in schools_consider:
+        optimize_frontier_add(frontier, school)
+
+    return frontier
+
+
+def optimize_frontier_add(frontier, school):
+    """Extends a frontier from optimize_frontier_calc with one more school.
+
+    Algorithm:
+    1.  Extend every frontier set by the school, up to Max Apps schools.
+    2.  Drop the sets of each size dominated by another set of that size.
+        Adding the same schools to both sets keeps the domination, so dropped
+        sets can't become optimal later.
+
+    :param frontier: Dict containing the frontier.
+    :param school: Dict of the added school, with data and calculated chance.
+    :return: Dict containing the frontier.
+    """
+    bounds = optimize_bounds_calc([school], {'Chance Mod': frontier["Chance Mod"]})
+
+    if frontier["Bounded"] and not bounds["Bounded"] and frontier["Schools"]:
+        # The kept sets were chosen assuming factors between 0 and 1, so start over without that assumption.
+        schools = frontier["Schools"]
+        frontier.update({"Schools": [], "Bounded": False, "Frontier": dict(), "Prefixes": [dict()]})
+        for earlier_school in schools:
+            optimize_frontier_add(frontier, earlier_school)
+
+    frontier["Bounded"] = frontier["Bounded"] and bounds["Bounded"]
+    index = len(frontier["Schools"])
+    frontier["Schools"].append(school)
+
+    combos_by_size = {0: [(0.0, 1.0, 1.0, ())]}
+    combos_by_size.update(frontier["Frontier"])
+    frontier_extended = dict()
+
+    # Algorithm Step 1.
+    for num_apps, combos in combos_by_size.items():
+        if num_apps >= frontier["Max Apps"]:
+            continue
+
+        extended = [(rank_sum + bounds["Rank"][0],
+                     running_no_chance * bounds["No Chance"][0],
+                     running_mod_no_total_chance * bounds["Mod No Total Chance"][0],
+                     indices + (index,))
+                    for rank_sum, running_no_chance, running_mod_no_total_chance, indices in combos]
+
+        # Algorithm Step 2.
+        frontier_extended[num_apps + 1] = _frontier_prune(combos_by_size.get(num_apps + 1, []) + extended,
+                                                          frontier["Bounded"])
+
+    frontier["Frontier"] = frontier_extended
+    frontier["Prefixes"].append(frontier_extended)
+
+    return frontier
+
+
+def optimize_frontier_remove(frontier, position):
+    """Removes a school from a frontier from optimize_frontier_calc.
+
+    The frontier of the schools before the removed one is kept, and only the
+    schools after it are added again.
+
+    :param frontier: Dict containing the frontier.
+    :param position: Int position of the removed school in the frontier's schools.
+    :return: Dict containing the frontier.
+    """
+    later_schools = frontier["Schools"][position + 1:]
+
+    del frontier["Schools"][position:]
+    del frontier["Prefixes"][position + 1:]
+    frontier["Frontier"] = frontier["Prefixes"][position]
+
+    for school in later_schools:
+        optimize_frontier_add(frontier, school)
+
+    return frontier
+
+
+def _frontier_prune(combos, bounded):
+    # Sorted so that a set can only be dominated by one before it.
+    combos = sorted(combos, key=lambda combo: (-combo[0], combo[1], combo[2], combo[3]))
+    kept = []
+
+    if not bounded:
+        for combo in combos:
+            if not any(kept_combo[1] <= combo[1] and kept_combo[2] == combo[2]
+                       and (kept_combo[0] > combo[0] or kept_combo[3] < combo[3]) for kept_combo in kept):
+                kept.append(combo)
+        return kept
+
+    # Staircase of the kept sets with higher rating sums: no-acceptance chances
+    # ascending, with mod no-acceptance chances strictly descending.
+    stair_no_chance = []
+    stair_mod_no_total_chance = []
+
+    for rank_sum, group in itertools.groupby(combos, key=itemgetter(0)):
+        group_kept = []
+
+        for combo in group:
+            position = bisect_right(stair_no_chance, combo[1])
+            if position and stair_mod_no_total_chance[position - 1] <= combo[2]:
+                continue
+            if any(kept_combo[1] <= combo[1] and kept_combo[2] <= combo[2] and kept_combo[3] < combo[3]
+                   for kept_combo in group_kept):
+                continue
+            group_kept.append(combo)
+
+        for combo in group_kept:
+            position = bisect_right(stair_no_chance, combo[1])
+            if position and stair_mod_no_total_chance[position - 1] <= combo[2]:
+                continue
+
+            end = position
+            while end < len(stair_no_chance) and stair_mod_no_total_chance[end] >= combo[2]:
+                end += 1
+            stair_no_chance[position:end] = [combo[1]]
+            stair_mod_no_total_chance[position:end] = [combo[2]]
+
+        kept.extend(group_kept)
+
+    return kept
+
+
+def optimize_frontier_search(frontier, params):
+    """Finds the optimal set of schools in a frontier from optimize_frontier_calc.
+
+    :param frontier: Dict containing the frontier, calculated with the same Chance Mod as params, and a
+                     Max Apps of at least its Num Apps.
+    :param params: Dict with optimization parameters.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
+    school_list_calcd = {"Best Score": 0,
+                         "Best Chance": 0,
+                         "Best Total Chance": 0,
+                         "Mod Best Chance": 0,
+                         "Mod Best Total Chance": 0}
+    best = None
+
+    for rank_sum, running_no_chance, running_mod_no_total_chance, indices \
+            in frontier["Frontier"].get(params['Num Apps'], []):
+        if 1 - running_no_chance > params['Chance Threshold'] and 1 - running_mod_no_total_chance \
+                > params['Threshold Mod'] and (best is None or rank_sum > best[0] or
+                                               (rank_sum == best[0] and indices < best[1])):
+            best = (rank_sum, indices)
+
+    if best is not None and best[0] / params['Num Apps'] > 0:
+        combo = tuple(frontier["Schools"][index] for index in best[1])
+        optimize_combo_store(school_list_calcd, combo, optimize_combo_calc(combo, params))
 
     return school_list_calcd
 
 
+def optimize_state_init(schools_consider):
+    """Creates a reusable optimization state for a list of potential schools.
+
+    The state keeps a frontier (see optimize_frontier_calc) for each Chance
+    Mod used so far, up to the largest Num Apps asked for with it, so changes
+    to the other optimization parameters are answered by lookups. Added
+    schools extend the frontiers in place, and removed schools are dropped
+    from them from their position on (see optimize_frontier_remove).
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :return: Dict containing the optimization state.
+    """
+    return {"Schools": list(schools_consider),
+            "Frontiers": dict()}
+
+
+def optimize_state_search(state, params):
+    """Finds the optimal set of schools in an optimization state.
+
+    :param state: Dict containing the optimization state.
+    :param params: Dict with optimization parameters.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
+    frontier = state["Frontiers"].get(params['Chance Mod'])
+
+    if frontier is None or frontier["Max Apps"] < params['Num Apps']:
+        frontier = optimize_frontier_calc(state["Schools"], params['Chance Mod'], max(params['Num Apps'], 0))
+        state["Frontiers"][params['Chance Mod']] = frontier
+
+    return optimize_frontier_search(frontier, params)
+
+
+def optimize_state_add(state, school):
+    """Adds a potential school to an optimization state.
+
+    :param state: Dict containing the optimization state.
+    :param school: Dict of the added school, with data and calculated chance.
+    :return: Dict containing the optimization state.
+    """
+    state["Schools"].append(school)
+
+    for frontier in state["Frontiers"].values():
+        optimize_frontier_add(frontier, school)
+
+    return state
+
+
+def optimize_state_remove(state, school):
+    """Removes a potential school from an optimization state.
+
+    :param state: Dict containing the optimization state.
+    :param school: Dict of the removed school.
+    :return: Dict containing the optimization state.
+    """
+    position = state["Schools"].index(school)
+    del state["Schools"][position]
+
+    for frontier in state["Frontiers"].values():
+        optimize_frontier_remove(frontier, position)
+
+    return state
+
+
+def optimize_branch_and_bound_search(schools_consider, params):
+    """Finds the optimal set of schools with an exact branch and bound search.
+
+    Returns the same set as optimize_exhaustive_search, including the choice
+    between sets with equal average ratings (the first in combination order).
+    Adding a school to a set can only raise both chances, so a partial set is
+    pruned when the best ratings or the best chances still reachable from the
+    remaining schools cannot satisfy the thresholds and beat the best set, or
+    when no reachable set satisfying the thresholds can beat it. The last
+    bound comes from a table of the best rank sums reachable with each
+    (rounded) share of the no-acceptance factors still needed.
+
+    Algorithm:
+    1.  Calc per-school rank, no-acceptance, and mod no-acceptance (incl.
+        backup) factors, and for every suffix of the school list the best
+        reachable rank sums, lowest reachable factor products, and best
+        reachable rank sums by the factors they reach.
+    2.  Depth-first search in order of rank, to find the optimal average
+        rating.
+    3.  Depth-first search in combination order for the first set reaching
+        the optimal average rating.
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :return: Dict containing optimized set of schools and data, unsorted.
+    """
+    school_list_calcd = {"Best Score": 0,
+                         "Best Chance": 0,
+                         "Best Total Chance": 0,
+                         "Mod Best Chance": 0,
+                         "Mod Best Total Chance": 0}
+    num_apps = params['Num Apps']
+
+    if num_apps < 1 or num_apps > len(schools_consider):
+        return school_list_calcd
+
+    # Algorithm Step 1.
+    with profile_span("optimize.branch_and_bound.step_1"):
+        bounds = optimize_bounds_calc(schools_consider, params)
+
+    # Algorithm Step 2.
+    with profile_span("optimize.branch_and_bound.step_2"):
+        rank_order = sorted(range(len(schools_consider)), key=lambda index: schools_consider[index]['Rank'],
+                            reverse=True)
+        profile_count("optimize.combinations",
+                      _branch_and_bound(schools_consider, params, bounds, rank_order, school_list_calcd, False))
+
+    if school_list_calcd['Best Score'] <= 0:
+        return school_list_calcd
+
+    # Algorithm Step 3.
+    with profile_span("optimize.branch_and_bound.step_3"):
+        profile_count("optimize.combinations",
+                      _branch_and_bound(schools_consider, params, bounds, list(range(len(schools_consider))),
+                                        school_list_calcd, True))
+
+    return school_list_calcd
+
+
+def optimize_bounds_calc(schools_consider, params):
+    """Calculates per-school factors used to bound partial sets of schools.
+
+    :param schools_consider: List of potential schools, with data and calculated chance.
+    :param params: Dict with optimization parameters.
+    :return: Dict with 'Rank', 'No Chance', and 'Mod No Total Chance' lists of
+             per-school factors, and whether the mod factors can be bounded.
+    """
+    bounds = {"Rank": [], "No Chance": [], "Mod No Total Chance": []}
+
+    for school in schools_consider:
+        phd_chance = school['PhD Chance'] if school['PhD'] == "Yes" else 0
+        ms_chance = school['MS Chance'] if school['MS'] == "Yes" else 0
+
+        bounds["Rank"].append(school['Rank'])
+        bounds["No Chance"].append(1 - (phd_chance if school['PhD'] == "Yes" else ms_chance))
+        bounds["Mod No Total Chance"].append(1 - (phd_chance + ((1 - phd_chance) * ms_chance * params['Chance Mod'])))
+
+    # Products of factors outside 0 to 1 (i.e. a large Chance Mod) aren't monotonic.
+    bounds["Bounded"] = all(0 <= factor <= 1 for factor in bounds["No Chance"] + bounds["Mod No Total Chance"])
+
+    return bounds
+
+
+def _suffix_tables(values, order, reverse, start, combine, size):
+    # tables[i][m] combines the m best values among order[i:], for m up to size.
+    tables = [None] * (len(order) + 1)
+    best = []
+
+    for position in range(len(order), -1, -1):
+        if position < len(order):
+            insort(best, -values[order[position]] if reverse else values[order[position]])
+            del best[size:]
+
+        table = [start]
+        for value in best:
+            table.append(combine(table[-1], -value if reverse else value))
+        tables[position] = table
+
+    return tables
+
+
+def _chance_rank_tables(ranks, factors, thresholds, order, size, units=32):
+    # tables[i, m, u, v] is the best rank sum of m schools among order[i:]
+    # with weights -log(factor) summing to at least u (no-acceptance) and v
+    # (mod no-acceptance incl. backup) of the units of weight needed to bring
+    # each product below 1 - threshold (-inf if none). Weights are rounded up
+    # to whole units and capped at all units, so every set reaching both
+    # thresholds reaches its units, and tables[i, m, u, v] bounds its rank sum.
+    needed = [-log(1 - threshold) if 0 < threshold < 1 else None for threshold in thresholds]
+    all_units = [0 if weight_needed is None else units for weight_needed in needed]
+    unit_weights = [[0 if weight_needed is None else units if factor <= 0
+                     else min(units, ceil(-log(factor) / weight_needed * units)) for factor in factor_list]
+                    for factor_list, weight_needed in zip(factors, needed)]
+
+    tables = np.full((len(order) + 1, size + 1, all_units[0] + 1, all_units[1] + 1), -np.inf)
+    tables[:, 0, 0, 0] = 0.0
+
+    for position in range(len(order) - 1, -1, -1):
+        index = order[position]
+        reached = [np.maximum(np.arange(count + 1) - weights[index], 0)
+                   for count, weights in zip(all_units, unit_weights)]
+        chosen = tables[position + 1, :-1][:, reached[0]][:, :, reached[1]] + ranks[index]
+        tables[position] = tables[position + 1]
+        tables[position, 1:] = np.maximum(tables[position + 1, 1:], chosen)
+
+    return needed, all_units, tables
+
+
+def _residual_units(weight_needed, units, running):
+    # Units of weight (see _chance_rank_tables) the remaining schools still have to add to a running product.
+    if weight_needed is None or running <= 0:
+        return 0
+
+    return min(units, max(0, ceil((weight_needed + log(running)) / weight_needed * units - 1e-9)))
+
+
+def _branch_and_bound(schools_consider, params, bounds, order, school_list_calcd, first_reaching_best):
+    num_apps = params['Num Apps']
+    ranks = bounds["Rank"]
+    no_chance = bounds["No Chance"]
+    mod_no_total_chance = bounds["Mod No Total Chance"]
+
+    best_ranks = _suffix_tables(ranks, order, True, 0.0, lambda total, value: total + value, num_apps)
+    if bounds["Bounded"]:
+        least_no_chance = _suffix_tables(no_chance, order, False, 1.0, lambda total, value: total * value, num_apps)
+        least_mod_no_total_chance = _suffix_tables(mod_no_total_chance, order, False, 1.0,
+                                                   lambda total, value: total * value, num_apps)
+        chance_ranks = _chance_rank_tables(ranks, (no_chance, mod_no_total_chance),
+                                           (params['Chance Threshold'], params['Threshold Mod']), order, num_apps)
+
+    chosen = []
+    evaluated = [0]
+    tolerance = 1e-9
+
+    def beaten(best_rank_sum):
+        if first_reaching_best:
+            return best_rank_sum / num_apps < school_list_calcd['Best Score'] - tolerance
+        return best_rank_sum / num_apps <= school_list_calcd['Best Score'] + tolerance * 1e-3
+
+    def reachable(position, remaining, rank_sum, running_no_chance, running_mod_no_total_chance):
+        if beaten(rank_sum + best_ranks[position][remaining]):
+            return False
+
+        if bounds["Bounded"]:
+            if 1 - running_no_chance * least_no_chance[position][remaining] \
+                    <= params['Chance Threshold'] - tolerance:
+                return False
+            if 1 - running_mod_no_total_chance * least_mod_no_total_chance[position][remaining] \
+                    <= params['Threshold Mod'] - tolerance:
+                return False
+
+            needed, all_units, tables = chance_ranks
+            no_chance_units = _residual_units(needed[0], all_units[0], running_no_chance)
+            mod_no_total_chance_units = _residual_units(needed[1], all_units[1], running_mod_no_total_chance)
+            if beaten(rank_sum + tables[position, remaining, no_chance_units, mod_no_total_chance_units] + tolerance):
+                return False
+
+        return True
+
+    def search(position, rank_sum, running_no_chance, running_mod_no_total_chance):
+        remaining = num_apps - len(chosen)
+
+        if remaining == 0:
+            evaluated[0] += 1
+            combo = tuple(schools_consider[index] for index in sorted(chosen))
+            combo_calcs = optimize_combo_calc(combo, params)
+
+            if combo_calcs[1] > params['Chance Threshold'] and combo_calcs[4] > params['Threshold Mod'] \
+                    and (combo_calcs[0] > school_list_calcd['Best Score']
+                         or (first_reaching_best and combo_calcs[0] == school_list_calcd['Best Score'])):
+                optimize_combo_store(school_list_calcd, combo, combo_calcs)
+                return True
+            return False
+
+        # Later positions only see a subset of the remaining schools, so their bounds can only be worse.
+        for next_position in range(position, len(order) - remaining + 1):
+            if not reachable(next_position, remaining, rank_sum, running_no_chance, running_mod_no_total_chance):
+                break
+
+            index = order[next_position]
+            chosen.append(index)
+            found = search(next_position + 1, rank_sum + ranks[index], running_no_chance * no_chance[index],
+                           running_mod_no_total_chance * mod_no_total_chance[index])
+            chosen.pop()
+
+            if found and first_reaching_best:
+                return True
+
+        return False
+
+    search(0, 0.0, 1.0, 1.0)
+
+    return evaluated[0]
+
+
 def optimize_tier_calc(school_list_calcd):
     """Breaks optimized school list into 3 tiers.
 
@@ -0,0 +1,264 @@
+"""Timing spans, counters, and memory use of the chance and optimization paths.
+
+Profiling is off by default, and a disabled span or counter is a single
+check of a module global, so instrumented code can stay in place. When
+enabled (profile_enable, or the CSGRAD_PROFILE environment variable), the
+following are collected:
+    - Spans: calls, total and max seconds of each named block, i.e. the
+      numbered chance_calc steps and optimize_overall_calc searches.
+    - SQL spans of executing (sql.<query>) and fetching (sql.<query>.fetch)
+      each query, and their row counts (sql.<query>.rows).
+    - Counters: i.e. simulations run and combinations evaluated.
+    - Peak memory traced by tracemalloc, if enabled with memory=True (or
+      CSGRAD_PROFILE=memory).
+Collected data can be exported as JSON or in the Prometheus text format.
+Work done in worker processes is not collected.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+PROMETHEUS_PREFIX = "csgrad_"
+
+_profile = None
+_no_span = nullcontext()
+
+
+class ProfileSpan:
+    """Context manager adding its elapsed time to a named span."""
+
+    def __init__(self, spans, name):
+        self._spans = spans
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self._start
+        span = self._spans.get(self._name)
+
+        if span is None:
+            self._spans[self._name] = {"Calls": 1, "Seconds": elapsed, "Max Seconds": elapsed}
+        else:
+            span["Calls"] += 1
+            span["Seconds"] += elapsed
+            span["Max Seconds"] = max(span["Max Seconds"], elapsed)
+
+        return False
+
+
+def profile_enable(memory=False):
+    """Starts collecting profile data, discarding any collected before.
+
+    :param memory: Bool to trace peak memory use with tracemalloc.
+    :return:
+    """
+    global _profile
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    else:
+        started_tracing = False
+
+    _profile = {"Spans": dict(),
+                "Counters": dict(),
+                "Memory": memory,
+                "Started Tracing": started_tracing,
+                "Start Time": time.time()}
+
+    if memory:
+        tracemalloc.reset_peak()
+
+
+def profile_disable():
+    """Stops collecting profile data.
+
+    :return: Dict from profile_report of the data collected, or None.
+    """
+    global _profile
+
+    if _profile is None:
+        return None
+
+    report = profile_report()
+
+    if _profile["Started Tracing"]:
+        tracemalloc.stop()
+
+    _profile = None
+
+    return report
+
+
+def profile_enabled():
+    """Checks whether profile data is being collected.
+
+    :return: Bool, true when enabled.
+    """
+    return _profile is not None
+
+
+def profile_span(name):
+    """Times a block of code as a named span.
+
+    Example:
+        with profile_span("chance.step_7"):
+            ...
+
+    :param name: String span name.
+    :return: Context manager.
+    """
+    if _profile is None:
+        return _no_span
+
+    return ProfileSpan(_profile["Spans"], name)
+
+
+def profile_count(name, value=1):
+    """Adds to a named counter.
+
+    :param name: String counter name.
+    :param value: Number to add.
+    :return:
+    """
+    if _profile is None:
+        return
+
+    counters = _profile["Counters"]
+    counters[name] = counters.get(name, 0) + value
+
+
+def profile_execute(name, cursor, query, args=None):
+    """Executes a query on a cursor, timed as the span sql.<name>.
+
+    :param name: String query name.
+    :param cursor: Database cursor.
+    :param query: String SQL query.
+    :param args: Optional query parameters.
+    :return: Result of cursor.execute.
+    """
+    if _profile is None:
+        return cursor.execute(query, args)
+
+    with ProfileSpan(_profile["Spans"], "sql." + name):
+        return cursor.execute(query, args)
+
+
+def profile_fetchall(name, cursor):
+    """Fetches every row of an executed query, timed as the span
+    sql.<name>.fetch and counted as sql.<name>.rows.
+
+    :param name: String query name, as given to profile_execute.
+    :param cursor: Database cursor.
+    :return: List of rows.
+    """
+    if _profile is None:
+        return cursor.fetchall()
+
+    with ProfileSpan(_profile["Spans"], "sql." + name + ".fetch"):
+        rows = cursor.fetchall()
+
+    profile_rows(name, len(rows))
+
+    return rows
+
+
+def profile_rows(name, rows):
+    """Counts rows returned by a query, as the counter sql.<name>.rows.
+
+    :param name: String query name.
+    :param rows: Int number of rows.
+    :return:
+    """
+    if _profile is None:
+        return
+
+    profile_count("sql." + name + ".rows", rows)
+
+
+def profile_report():
+    """Collects the profile data.
+
+    :return: Dict with 'Spans', 'Counters', 'Seconds' since enabled, and
+             'Peak Memory' in bytes (None without memory tracing), or None
+             when disabled.
+    """
+    if _profile is None:
+        return None
+
+    if _profile["Memory"] and tracemalloc.is_tracing():
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    else:
+        peak_memory = None
+
+    return {"Spans": {name: dict(span) for name, span in sorted(_profile["Spans"].items())},
+            "Counters": dict(sorted(_profile["Counters"].items())),
+            "Seconds": time.time() - _profile["Start Time"],
+            "Peak Memory": peak_memory}
+
+
+def profile_json():
+    """Exports the profile data as JSON.
+
+    :return: String JSON of profile_report.
+    """
+    return json.dumps(profile_report(), indent=2)
+
+
+def profile_prometheus():
+    """Exports the profile data in the Prometheus text format.
+
+    Example:
+        # TYPE csgrad_span_seconds_total counter
+        csgrad_span_seconds_total{span="chance.step_7"} 0.412
+
+    :return: String of Prometheus metrics (empty when disabled).
+    """
+    report = profile_report()
+
+    if report is None:
+        return ""
+
+    lines = []
+
+    for metric, metric_type, key in (("span_calls_total", "counter", "Calls"),
+                                     ("span_seconds_total", "counter", "Seconds"),
+                                     ("span_max_seconds", "gauge", "Max Seconds")):
+        lines.append("# TYPE " + PROMETHEUS_PREFIX + metric + " " + metric_type)
+        lines += [PROMETHEUS_PREFIX + metric + '{span="' + _label(name) + '"} ' + repr(span[key])
+                  for name, span in report["Spans"].items()]
+
+    lines.append("# TYPE " + PROMETHEUS_PREFIX + "count_total counter")
+    lines += [PROMETHEUS_PREFIX + 'count_total{name="' + _label(name) + '"} ' + repr(value)
+              for name, value in report["Counters"].items()]
+
+    if report["Peak Memory"] is not None:
+        lines.append("# TYPE " + PROMETHEUS_PREFIX + "peak_memory_bytes gauge")
+        lines.append(PROMETHEUS_PREFIX + "peak_memory_bytes " + str(report["Peak Memory"]))
+
+    return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+if os.environ.get("CSGRAD_PROFILE"):
+    profile_enable(memory=os.environ["CSGRAD_PROFILE"].lower() == "memory")
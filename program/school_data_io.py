@@ -1,10 +1,8 @@
 """School data input and output functions."""
 
-import warnings
-import pymysql
 from data.test_user_school_data import test_school_data
 from helper import float_in_range
-from pymysql import Error
+from school_directory import school_directory_load, school_directory_search
 
 __author__ = "Jacob Lydon"
 __copyright__ = "Copyright 2017"
@@ -17,12 +15,12 @@ __email__ = "jlydon001@regis.edu"
 __status__ = "Development"
 
 
-def school_data_in(db_connection, test_schools):
+def school_data_in(db_connection, test_schools, directory=None):
     """Populates a list of schools the user is considering, with user rankings.
 
-    Checks the database for matching string fragments to user input.
+    Checks the school directory for matching string fragments to user input.
         - Example: Enter "Stan" for Stanford and the program searches the
-        database for *Stan* (not case sensitive) and fetches all matches.
+        directory for *Stan* (not case sensitive) and fetches all matches.
     Confirms choice by iterating fetched schools in order of data prevalence.
         - More popular schools require fewer letters.
         - Use well-known abbreviations when possible (i.e. UCLA or MIT)
@@ -33,11 +31,12 @@ def school_data_in(db_connection, test_schools):
 
     :param db_connection: Database connection to csdata.
     :param test_schools: List of test school data.
+    :param directory: Dict containing the school directory. Loaded from
+                      db_connection if not given.
     :return: List of potential schools.
     """
-    cursor = db_connection.cursor(pymysql.cursors.DictCursor)
-
-    warnings.filterwarnings("ignore", category=pymysql.Warning)
+    if directory is None:
+        directory = school_directory_load(db_connection)
 
     if test_schools:
         schools = test_school_data()
@@ -56,35 +55,11 @@ def school_data_in(db_connection, test_schools):
         school_match = False
         school = dict()
 
-        try:
-            cursor.execute("""
-            SELECT School,
-                COUNT(ID)AS Total,
-                COUNT(case when Degree = "PhD" then Degree end) AS PhD ,
-                COUNT(case when Degree = "MS" then Degree end) AS MS ,
-                COUNT(case when Degree = "PhD" then GREQ end) AS QuantPhD,
-                COUNT(case when Degree = "PhD" then GPA end) AS GPAPhD,
-                COUNT(case when Degree = "MS" then GREQ end) AS QuantMS,
-                COUNT(case when Degree = "MS" then GPA end) AS GPAMS
-            FROM csdata
-            WHERE School LIKE '%""" + school_query + """%'
-            GROUP BY School
-            ORDER BY Total desc
-            """)
-        except Error as e:
-            print(e, "\n")
-        else:
-            item = cursor.fetchone()
-
-            while item is not None:
-                school_data = item
-
-                if input("Did you mean " + school_data['School'] + " ('Y' or any other key): ").lower() in ['y', 'yes']:
-                    school['Name'] = school_data['School']
-                    school_match = True
-                    break
-                else:
-                    item = cursor.fetchone()
+        for school_data in school_directory_search(directory, school_query):
+            if input("Did you mean " + school_data['School'] + " ('Y' or any other key): ").lower() in ['y', 'yes']:
+                school['Name'] = school_data['School']
+                school_match = True
+                break
 
         if school_match and ((school_data['PhD'] > 1 and school_data['QuantPhD'] > 1 and school_data['GPAPhD'] > 1)
                              or (school_data['MS'] > 1 and school_data['QuantMS'] > 1 and school_data['GPAMS'] > 1)):
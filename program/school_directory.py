@@ -0,0 +1,166 @@
+"""In-memory directory of csdata schools for school name lookups.
+
+The directory is loaded from the database once and holds each school's name
+and data counts, in order of data prevalence (Total). Name fragments are
+matched through a trigram index, so lookups are in-process and don't touch
+the database.
+"""
+
+import warnings
+from columnar import ColumnarStore
+from database import pymysql
+from profiling import profile_execute, profile_fetchall
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+DIRECTORY_COLUMNS = ("School", "Total", "PhD", "MS", "QuantPhD", "GPAPhD", "QuantMS", "GPAMS")
+
+
+def school_directory_load(db_connection):
+    """Loads the school directory from csdata.
+
+    Fetches the following counts for each school:
+        - Total applicants
+        - PhD and MS applicants
+        - PhD and MS applicants with a GRE Quantitative score
+        - PhD and MS applicants with a GPA
+
+    :param db_connection: Database connection to csdata, or a ColumnarStore.
+    :return: Dict containing the school directory.
+    """
+    if isinstance(db_connection, ColumnarStore):
+        return school_directory_build(db_connection.directory_rows())
+
+    return school_directory_build(_school_directory_query(db_connection))
+
+
+def school_directory_update(directory, db_connection, school_names):
+    """Recounts the data of some schools, i.e. after an incremental load.
+
+    Only the given schools are queried. Their entries are replaced (or
+    added) and the directory's order and trigram index are rebuilt.
+
+    :param directory: Dict containing the school directory.
+    :param db_connection: Database connection to csdata.
+    :param school_names: Iterable of school names to recount.
+    :return: Dict containing the updated school directory.
+    """
+    school_names = set(school_names)
+    school_rows = [school_data for school_data in directory['Schools'] if school_data['School'] not in school_names]
+    school_names = sorted(school_names)
+
+    for start in range(0, len(school_names), 500):
+        names = school_names[start:start + 500]
+        school_rows += _school_directory_query(db_connection, "WHERE School IN ("
+                                               + ", ".join(["%s"] * len(names)) + ")", names)
+
+    return school_directory_build(school_rows)
+
+
+def school_directory_build(school_rows):
+    """Builds the school directory and its trigram index.
+
+    :param school_rows: List of dicts containing school counts, as queried by
+                        school_directory_load.
+    :return: Dict containing the school directory.
+    """
+    schools = sorted(school_rows, key=lambda school_data: school_data['Total'], reverse=True)
+    names = [school_data['School'].lower() for school_data in schools]
+    trigrams = dict()
+
+    for position, name in enumerate(names):
+        for trigram in _trigrams(name):
+            trigrams.setdefault(trigram, []).append(position)
+
+    return {"Schools": schools,
+            "Names": names,
+            "Trigrams": trigrams}
+
+
+def school_directory_search(directory, school_query):
+    """Finds schools whose names contain a string fragment.
+
+    Matching is not case sensitive, like the database's LIKE '%fragment%'.
+    Matches are returned in order of data prevalence.
+        - Example: "Stan" matches Stanford University.
+
+    :param directory: Dict containing the school directory.
+    :param school_query: String fragment of a school name.
+    :return: List of dicts containing matching school counts.
+    """
+    school_query = school_query.lower()
+    query_trigrams = _trigrams(school_query)
+
+    if query_trigrams:
+        postings = sorted((directory['Trigrams'].get(trigram, []) for trigram in query_trigrams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        positions = sorted(candidates)
+    else:
+        positions = range(len(directory['Names']))
+
+    return [directory['Schools'][position] for position in positions
+            if school_query in directory['Names'][position]]
+
+
+def school_directory_resolve(directory, school_queries):
+    """Resolves a list of school names or fragments to directory entries.
+
+    An exact (not case sensitive) name match is preferred, otherwise the most
+    prevalent school containing the fragment is chosen.
+
+    :param directory: Dict containing the school directory.
+    :param school_queries: List of school names or fragments.
+    :return: List of dicts containing school counts, None where nothing matched.
+    """
+    resolved = []
+
+    for school_query in school_queries:
+        matches = school_directory_search(directory, school_query)
+        exact = [school_data for school_data in matches if school_data['School'].lower() == school_query.lower()]
+
+        if exact:
+            resolved.append(exact[0])
+        elif matches:
+            resolved.append(matches[0])
+        else:
+            resolved.append(None)
+
+    return resolved
+
+
+def _school_directory_query(db_connection, where="", args=None):
+    cursor = db_connection.cursor()
+
+    if pymysql is not None:
+        warnings.filterwarnings("ignore", category=pymysql.Warning)
+
+    profile_execute("school_directory", cursor, """
+        SELECT School,
+            COUNT(ID)AS Total,
+            COUNT(case when Degree = 'PhD' then Degree end) AS PhD ,
+            COUNT(case when Degree = 'MS' then Degree end) AS MS ,
+            COUNT(case when Degree = 'PhD' then GREQ end) AS QuantPhD,
+            COUNT(case when Degree = 'PhD' then GPA end) AS GPAPhD,
+            COUNT(case when Degree = 'MS' then GREQ end) AS QuantMS,
+            COUNT(case when Degree = 'MS' then GPA end) AS GPAMS
+        FROM csdata
+        """ + where + """
+        GROUP BY School
+        ORDER BY Total desc
+        """, args)
+    school_rows = [dict(zip(DIRECTORY_COLUMNS, row)) for row in profile_fetchall("school_directory", cursor)]
+    cursor.close()
+
+    return school_rows
+
+
+def _trigrams(text):
+    return {text[position:position + 3] for position in range(len(text) - 2)}
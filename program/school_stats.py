@@ -0,0 +1,224 @@
+"""Materializes per-school aggregate statistics of the csdata database.
+
+The school_stats table holds one row per school and degree type with the
+counts, averages, and std. devs. used by chance calculations, so the chance
+path reads a keyed summary row instead of aggregating all of csdata. Each
+row also stores the school's SchoolModel statistics (see chance.py), which
+do not depend on the student profile. Run this file to rebuild the summary
+after new data is loaded into csdata.
+"""
+
+import os
+from chance import SCHOOL_MODEL_STATS, chance_school_model
+from chance_cache import chance_dataset_hash
+from database import DEFAULT_SQLITE_PATH, DatabaseError, dict_cursor, mysql_connect, sqlite_connect
+from profiling import profile_execute, profile_fetchall
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+
+def school_stats_create(db_connection):
+    """Creates the school_stats and school_stats_version tables if they do not exist.
+
+    :param db_connection: Database connection to csdata.
+    :return:
+    """
+    cursor = db_connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS school_stats (
+            School VARCHAR(255) NOT NULL,
+            Degree VARCHAR(16) NOT NULL,
+            Applicants INT NOT NULL,
+            Accepted INT NOT NULL,
+            Rejected INT NOT NULL,
+            GPA DOUBLE,
+            GPADev DOUBLE,
+            Verbal DOUBLE,
+            VerbalDev DOUBLE,
+            Quant DOUBLE,
+            QuantDev DOUBLE,
+            Combined DOUBLE,
+            CombinedDev DOUBLE,
+            AW DOUBLE,
+            AWDev DOUBLE,
+            AcceptRate DOUBLE,
+            Applied DOUBLE,
+            AcceptHigh DOUBLE,
+            AcceptLow DOUBLE,
+            SampleZ DOUBLE,
+            BelowStdDev DOUBLE,
+            AboveStdDev DOUBLE,
+            PRIMARY KEY (School, Degree)
+        )
+        """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS school_stats_version (Version CHAR(64) NOT NULL)")
+    cursor.close()
+
+
+def school_stats_refresh(db_connection, programs=None):
+    """Rebuilds the school_stats table from csdata.
+
+    Aggregates the following data for each school and degree type:
+        - Number of applicants
+        - Accepted
+        - Rejected
+        - GPA (avg. and std. dev.)
+        - GRE Quantitative (avg. and std. dev.)
+        - GRE Verbal (avg. and std. dev.)
+        - GRE Combined (avg. and std. dev.)
+        - GRE A/W (avg. and std. dev.)
+    Then builds and stores the SchoolModel statistics of every school and
+    degree with at least 1 applicant accepted or rejected. The table is
+    dropped first, so its schema follows school_stats_create.
+
+    With programs, only the rows of those schools and degrees are deleted
+    and rebuilt (i.e. after an incremental load), and other rows are left
+    untouched.
+
+    Either way, a new version stamp of the school_stats data is stored for
+    the chance cache (see school_stats_version_update).
+
+    :param db_connection: Database connection to csdata.
+    :param programs: Optional iterable of (School, Degree) tuples to refresh.
+    :return: Int number of school and degree rows in school_stats.
+    """
+    if programs is None:
+        cursor = db_connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS school_stats")
+        cursor.close()
+
+        school_stats_create(db_connection)
+
+        school_stats_insert(db_connection)
+        school_stats_model_update(db_connection)
+    else:
+        school_stats_create(db_connection)
+        programs = sorted(set(programs))
+
+        # Chunks bound the length of the (School, Degree) OR chains.
+        for start in range(0, len(programs), 200):
+            program_filter, program_keys = _program_filter(programs[start:start + 200])
+
+            cursor = db_connection.cursor()
+            cursor.execute("DELETE FROM school_stats WHERE " + program_filter, program_keys)
+            cursor.close()
+
+            school_stats_insert(db_connection, program_filter, program_keys)
+            school_stats_model_update(db_connection, program_filter, program_keys)
+
+    cursor = db_connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM school_stats")
+    row_count = cursor.fetchone()[0]
+    cursor.close()
+
+    school_stats_version_update(db_connection)
+    db_connection.commit()
+
+    return row_count
+
+
+def school_stats_version_update(db_connection):
+    """Stores the version stamp of the school_stats data.
+
+    The chance cache reads this single row rather than hashing school_stats
+    on every cached call.
+
+    :param db_connection: Database connection to csdata.
+    :return: String version of the school_stats data.
+    """
+    version = chance_dataset_hash(db_connection)
+
+    cursor = db_connection.cursor()
+    cursor.execute("DELETE FROM school_stats_version")
+    cursor.execute("INSERT INTO school_stats_version (Version) VALUES (%s)", (version,))
+    cursor.close()
+
+    return version
+
+
+def school_stats_insert(db_connection, program_filter="1 = 1", program_keys=()):
+    """Aggregates csdata into school_stats rows (see school_stats_refresh).
+
+    :param db_connection: Database connection to csdata.
+    :param program_filter: SQL condition on csdata rows to aggregate.
+    :param program_keys: List of parameters of program_filter.
+    :return:
+    """
+    cursor = db_connection.cursor()
+    profile_execute("school_stats_insert", cursor, """
+        INSERT INTO school_stats (School, Degree, Applicants, Accepted, Rejected, GPA, GPADev, Verbal, VerbalDev,
+                                  Quant, QuantDev, Combined, CombinedDev, AW, AWDev)
+        SELECT
+            School,
+            Degree,
+            COUNT(ID) AS Applicants,
+            COALESCE(SUM(Status LIKE 'Accepted'), 0) AS Accepted,
+            COALESCE(SUM(Status LIKE 'Rejected'), 0) AS Rejected,
+            (AVG(GPA) + 0E0) AS GPA,
+            STDDEV_SAMP(GPA) As GPADev,
+            (AVG(GREV) + 0E0) AS Verbal,
+            STDDEV_SAMP(GREV) AS VerbalDev,
+            (AVG(GREQ) + 0E0) AS Quant,
+            STDDEV_SAMP(GREQ) AS QuantDev,
+            (AVG(GRET) + 0E0) AS Combined,
+            STDDEV_SAMP(GRET) CombinedDev,
+            (AVG(GREAW) + 0E0) AS AW,
+            STDDEV_SAMP(GREAW) AS AWDev
+        FROM csdata
+        WHERE """ + program_filter + """
+        GROUP BY School, Degree
+        """, list(program_keys))
+    cursor.close()
+
+
+def school_stats_model_update(db_connection, program_filter="1 = 1", program_keys=()):
+    """Stores the SchoolModel statistics of school_stats rows.
+
+    :param db_connection: Database connection to csdata.
+    :param program_filter: SQL condition on school_stats rows to update.
+    :param program_keys: List of parameters of program_filter.
+    :return:
+    """
+    cursor = dict_cursor(db_connection)
+    profile_execute("school_stats_models", cursor,
+                    "SELECT * FROM school_stats WHERE (Accepted + Rejected) > 0 AND (" + program_filter + ")",
+                    list(program_keys))
+    school_models = [chance_school_model(school_data)
+                     for school_data in profile_fetchall("school_stats_models", cursor)]
+    cursor.close()
+
+    cursor = db_connection.cursor()
+    cursor.executemany("UPDATE school_stats SET " + ", ".join(field + " = %s" for field in SCHOOL_MODEL_STATS)
+                       + " WHERE School = %s AND Degree = %s",
+                       [[getattr(school_model, field) for field in SCHOOL_MODEL_STATS]
+                        + [school_model.School, school_model.Degree] for school_model in school_models])
+    cursor.close()
+
+
+def _program_filter(programs):
+    program_keys = [key for program in programs for key in program]
+
+    return " OR ".join(["(School = %s AND Degree = %s)"] * len(programs)), program_keys
+
+
+if __name__ == "__main__":
+    try:
+        if os.path.exists(DEFAULT_SQLITE_PATH):
+            conn = sqlite_connect(DEFAULT_SQLITE_PATH)
+        else:
+            conn = mysql_connect(input("Please enter the root user MySQL password: "))
+
+    except DatabaseError as e:
+        print(e, "\nNo database connection. Please restart to try again.")
+
+    else:
+        print("Refreshed school_stats with", school_stats_refresh(conn), "school and degree rows.")
+        conn.close()
@@ -0,0 +1,330 @@
+"""Local HTTP service for chance scoring, school search, and optimization.
+
+Serves the chance_calc and optimize_overall_calc steps of main.py to an
+advising front-end, as JSON over aiohttp:
+    GET  /health    Dataset version and number of programs loaded.
+    GET  /schools   School directory search, i.e. /schools?q=Stan&limit=10.
+    POST /chance    {"Profile": {...}, "Schools": [...]} scores a student
+                    profile (keys as in user_data_in) against potential
+                    schools (Name, Rank, PhD, MS, Backup). With "Params"
+                    (the keys and ranges of optimize_input), the list is
+                    optimized too.
+                    Optional "Instances", "Seed" (a non-negative integer),
+                    and "Method". The "exhaustive" and "vectorized"
+                    methods are refused for more than MAX_EXHAUSTIVE_COMBOS
+                    combinations of schools.
+    POST /optimize  {"Schools": [...], "Params": {...}} optimizes schools
+                    with calculated 'PhD Chance' and 'MS Chance'.
+    POST /reload    Reloads the school statistics, i.e. after an ingest.
+
+At startup, the school statistics and directory are read once over a small
+connection pool and kept in memory. Simulation and optimization run in a
+pool of worker processes holding their own copy of the statistics, so the
+event loop only parses requests and searches the directory.
+
+Run this file to serve the local SQLite csdata file (--help for options).
+"""
+
+import argparse
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+from aiohttp import web
+import numpy as np
+from batch import batch_params, batch_profile, batch_school_chances, batch_schools
+from chance import SchoolModel, chance_matrix, chance_query, chance_school_model_data
+from chance_cache import chance_dataset_version
+from database import DEFAULT_POOL_SIZE, DEFAULT_SQLITE_PATH, database_pool, mysql_connect, sqlite_connect
+from optimize import optimize_overall_calc
+from profiling import profile_fetchall
+from school_directory import school_directory_load, school_directory_search
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+# optimize_overall_calc methods run in a worker ("parallel" starts its own processes).
+SERVICE_METHODS = ("branch_and_bound", "exhaustive", "vectorized", "frontier")
+
+MAX_INSTANCES = 100000
+
+# Combinations of schools the methods evaluating every combination may be asked for.
+MAX_EXHAUSTIVE_COMBOS = 200000
+
+# Optimization parameters a request may give, with their ranges in optimize_input (None for the number of schools).
+SERVICE_PARAMS = {'Chance Threshold': (0, 1), 'Num Apps': (0, None), 'Chance Mod': (0, 10), 'Threshold Mod': (0, 1)}
+
+# School statistics of a worker process, keyed by (School, Degree).
+_school_stats = dict()
+
+
+def service_app(connect, pool_size=DEFAULT_POOL_SIZE, workers=None):
+    """Creates the service application.
+
+    :param connect: Function without arguments opening a database
+                    connection to csdata, usable from any thread.
+    :param pool_size: Int number of pooled database connections.
+    :param workers: Int number of worker processes. Defaults to the number
+                    of CPUs.
+    :return: aiohttp web Application.
+    """
+    app = web.Application()
+    app["service"] = {"Pool": database_pool(connect, pool_size),
+                      "Workers": workers or os.cpu_count(),
+                      "Executor": None}
+
+    app.router.add_get("/health", service_health)
+    app.router.add_get("/schools", service_schools)
+    app.router.add_post("/chance", service_chance)
+    app.router.add_post("/optimize", service_optimize)
+    app.router.add_post("/reload", service_reload)
+
+    app.on_startup.append(service_load)
+    app.on_cleanup.append(_service_cleanup)
+
+    return app
+
+
+async def service_load(app):
+    """Loads the school statistics and directory, and starts fresh workers.
+
+    :param app: aiohttp web Application.
+    :return:
+    """
+    service = app["service"]
+    loop = asyncio.get_running_loop()
+    loaded = await loop.run_in_executor(None, _service_read, service["Pool"])
+
+    executor = ProcessPoolExecutor(max_workers=service["Workers"], initializer=_service_init,
+                                   initargs=(loaded["School Rows"],))
+
+    # Start every worker now, so the first requests don't wait on them.
+    await asyncio.gather(*[loop.run_in_executor(executor, _service_ready) for _ in range(service["Workers"])])
+
+    previous_executor = service["Executor"]
+    service.update({"Executor": executor,
+                    "Directory": loaded["Directory"],
+                    "Version": loaded["Version"],
+                    "Programs": len(loaded["School Rows"])})
+
+    if previous_executor is not None:
+        previous_executor.shutdown(wait=False)
+
+
+async def service_health(request):
+    service = request.app["service"]
+
+    return web.json_response({"Status": "OK", "Version": service["Version"], "Programs": service["Programs"],
+                              "Workers": service["Workers"], "Pool": service["Pool"].status()})
+
+
+async def service_schools(request):
+    directory = request.app["service"]["Directory"]
+    school_query = request.query.get("q", "")
+
+    try:
+        limit = int(request.query.get("limit", 10))
+    except ValueError:
+        return _service_error("limit is not a number")
+
+    return web.json_response({"Schools": school_directory_search(directory, school_query)[:limit]})
+
+
+async def service_chance(request):
+    service = request.app["service"]
+    body = await _service_body(request)
+
+    if isinstance(body, web.Response):
+        return body
+
+    try:
+        _, user_data = batch_profile(body.get("Profile") or dict(), None)
+        schools, unknown = batch_schools(body.get("Schools") or (), service["Directory"])
+        params = _service_params(body["Params"], len(schools)) if body.get("Params") else None
+        instances = int(body.get("Instances", 1000))
+        seed = _service_seed(body.get("Seed"))
+        method = _service_method(body.get("Method", "branch_and_bound"), len(schools), params)
+    except (KeyError, TypeError, ValueError) as e:
+        return _service_error(e)
+
+    if not 0 < instances <= MAX_INSTANCES:
+        return _service_error("Instances must be between 1 and " + str(MAX_INSTANCES))
+
+    result = await asyncio.get_running_loop().run_in_executor(service["Executor"], _service_score, user_data, schools,
+                                                              params, method, instances, seed)
+    result["Unknown Schools"] = unknown
+
+    return web.json_response(result)
+
+
+async def service_optimize(request):
+    body = await _service_body(request)
+
+    if isinstance(body, web.Response):
+        return body
+
+    try:
+        schools = [_service_school(school) for school in body["Schools"]]
+        params = _service_params(body["Params"], len(schools))
+        method = _service_method(body.get("Method", "branch_and_bound"), len(schools), params)
+    except (KeyError, TypeError, ValueError) as e:
+        return _service_error(e)
+
+    optimized = await asyncio.get_running_loop().run_in_executor(request.app["service"]["Executor"],
+                                                                 optimize_overall_calc, schools, params, method)
+
+    return web.json_response({"Optimized": optimized})
+
+
+async def service_reload(request):
+    await service_load(request.app)
+
+    return await service_health(request)
+
+
+async def _service_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return _service_error("Request body is not JSON")
+
+    if not isinstance(body, dict):
+        return _service_error("Request body is not a JSON object")
+
+    return body
+
+
+def _service_error(message, status=400):
+    if isinstance(message, KeyError):
+        message = "Missing " + str(message)
+
+    return web.json_response({"Error": str(message)}, status=status)
+
+
+def _service_school(school):
+    school = {'Name': str(school['Name']),
+              'Rank': float(school['Rank']),
+              'PhD': school.get('PhD', "No"),
+              'MS': school.get('MS', "No"),
+              'Backup': school.get('Backup', "MS"),
+              'PhD Chance': float(school.get('PhD Chance', 0)),
+              'MS Chance': float(school.get('MS Chance', 0))}
+
+    for key in ('PhD Chance', 'MS Chance'):
+        if not 0 <= school[key] <= 1:
+            raise ValueError(key + " must be between 0 and 1")
+
+    return school
+
+
+def _service_seed(seed):
+    # Bools are ints in Python, and numpy only takes non-negative seeds.
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        raise ValueError("Seed must be a non-negative integer or null")
+
+    return seed
+
+
+def _service_params(params, num_schools):
+    if not isinstance(params, dict):
+        raise ValueError("Params must be a JSON object")
+
+    for key, value in params.items():
+        if key not in SERVICE_PARAMS:
+            raise ValueError("Unknown parameter: " + str(key))
+
+        low, high = SERVICE_PARAMS[key]
+        high = num_schools if high is None else high
+        number_types = int if key == 'Num Apps' else (int, float)
+
+        # Bools are ints in Python.
+        if not isinstance(value, number_types) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(key + " must be a" + (" whole" if key == 'Num Apps' else "") + " number between "
+                             + str(low) + " and " + str(high))
+
+    return batch_params(**params)
+
+
+def _service_method(method, num_schools, params):
+    if method not in SERVICE_METHODS:
+        raise ValueError("Unknown optimize method: " + str(method))
+
+    if method in ("exhaustive", "vectorized") and params is not None and 0 <= params['Num Apps'] <= num_schools \
+            and comb(num_schools, params['Num Apps']) > MAX_EXHAUSTIVE_COMBOS:
+        raise ValueError("The " + method + " method is limited to " + str(MAX_EXHAUSTIVE_COMBOS)
+                         + " combinations of schools")
+
+    return method
+
+
+def _service_read(pool):
+    with pool.connection() as db_connection:
+        cursor = chance_query(db_connection, None)
+        school_rows = [chance_school_model_data(SchoolModel._make(item))
+                       for item in profile_fetchall("chance_query", cursor)]
+        cursor.close()
+
+        return {"School Rows": school_rows,
+                "Directory": school_directory_load(db_connection),
+                "Version": chance_dataset_version(db_connection)}
+
+
+async def _service_cleanup(app):
+    service = app["service"]
+
+    if service["Executor"] is not None:
+        service["Executor"].shutdown()
+
+    service["Pool"].close()
+
+
+def _service_init(school_rows):
+    global _school_stats
+
+    _school_stats = {(school_data['School'], school_data['Degree']): school_data for school_data in school_rows}
+
+
+def _service_ready():
+    return len(_school_stats)
+
+
+def _service_score(user_data, schools, params, method, instances, seed):
+    school_rows = [_school_stats[(school['Name'], degree)] for school in schools for degree in ("PhD", "MS")
+                   if school[degree] == "Yes" and (school['Name'], degree) in _school_stats]
+
+    matrix = chance_matrix(None, [user_data], schools, instances, np.random.default_rng(seed), school_rows)
+    scored = batch_school_chances(schools, matrix["Programs"], matrix["Chances"][0])
+    result = {"Chances": scored["Chances"], "No Data": scored["No Data"]}
+
+    if params is not None:
+        result["Optimized"] = optimize_overall_calc(scored["Schools"], params, method=method)
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves chance scoring, school search, and optimization over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=DEFAULT_SQLITE_PATH, help="SQLite csdata file")
+    parser.add_argument("--mysql", action="store_true",
+                        help="use the MySQL database, with the password in CSDATA_MYSQL_PASSWORD")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="pooled database connections")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to the number of CPUs)")
+    args = parser.parse_args()
+
+    if args.mysql:
+        def service_connect():
+            return mysql_connect(os.environ.get("CSDATA_MYSQL_PASSWORD", ""))
+    else:
+        def service_connect():
+            return sqlite_connect(args.db, read_only=True, shared=True)
+
+    web.run_app(service_app(service_connect, args.pool_size, args.workers), host=args.host, port=args.port)
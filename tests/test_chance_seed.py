@@ -0,0 +1,67 @@
+"""Checks that a seeded chance only depends on its school and degree.
+
+Chances are calculated on a small synthetic csdata table (see
+synthetic_csdata.py) for the test profile and school list.
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "program"),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")]
+
+from chance import chance_calc  # noqa: E402
+from data import test_user_school_data  # noqa: E402
+from database import sqlite_connect  # noqa: E402
+from synthetic_csdata import synthetic_sqlite  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+
+@pytest.fixture(scope="module")
+def db_connection(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("csdata") / "csdata.db")
+    synthetic_sqlite(path, 20000, 20)
+    connection = sqlite_connect(path, read_only=True)
+    yield connection
+    connection.close()
+
+
+def _chances(db_connection, schools, **options):
+    schools = [dict(school) for school in schools]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        chance_calc(db_connection, test_user_school_data.test_user_data(), schools, seed=1, **options)
+
+    return {(school['Name'], degree): school[degree + " Chance"] for school in schools for degree in ("PhD", "MS")
+            if degree + " Chance" in school}
+
+
+@pytest.mark.parametrize("method", ["vectorized", "adaptive", "sobol"])
+def test_seeded_chance_alone_and_in_list(db_connection, method):
+    schools = test_user_school_data.test_school_data()
+    listed = _chances(db_connection, schools, method=method)
+
+    assert listed
+    for school in schools:
+        for program, chance in _chances(db_connection, [school], method=method).items():
+            assert chance == listed[program]
+
+
+def test_seeded_chance_with_workers(db_connection):
+    schools = test_user_school_data.test_school_data()
+
+    assert _chances(db_connection, schools, workers=2) == _chances(db_connection, schools)
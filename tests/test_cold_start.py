@@ -0,0 +1,33 @@
+"""Checks the cold start of the CLI entry point modules.
+
+Each module is imported by a new interpreter (see bench_cold_start), which
+must not load SciPy and must stay within the cold-start budget.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+
+from bench import COLD_START_MODULES, DEFAULT_COLD_START_BUDGET, bench_cold_start  # noqa: E402
+
+__author__ = "Jacob Lydon"
+__copyright__ = "Copyright 2017"
+__credits__ = []
+
+__license__ = "GPLv3"
+__version__ = "0.1"
+__maintainer__ = "Jacob Lydon"
+__email__ = "jlydon001@regis.edu"
+__status__ = "Development"
+
+
+@pytest.mark.parametrize("module", COLD_START_MODULES)
+def test_cold_start(module):
+    result = bench_cold_start([module], 3, DEFAULT_COLD_START_BUDGET)[0]
+
+    assert not result["SciPy Loaded"], "importing " + module + " loads SciPy"
+    assert result["Seconds"]["Median"] <= DEFAULT_COLD_START_BUDGET, \
+        module + " takes " + str(round(result["Seconds"]["Median"], 3)) + " s to import"